@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import Counter
+
+from intent_parser import parse_intent
+from plan_compiler import PlanCompiler, plan_ticks
+from tracing import ReplayLLM, load_trace, replay
+
+# Plans as the LLM tends to write them for common instructions, starting from
+# the middle of a 15x15 grid facing up.
+SAMPLE_PLANS = {
+    "move forward 3 then 2 more": ["forward 3", "forward 2"],
+    "square pattern": ["forward 2", "turn right", "forward 2", "turn right", "forward 2", "turn right",
+                       "forward 2", "turn right"],
+    "spin around": ["turn right", "turn right", "turn right", "turn right"],
+    "turn around": ["turn left", "turn left"],
+    "three rights": ["turn right", "turn right", "turn right", "forward 1"],
+    "wiggle": ["turn left", "turn right", "forward 1", "turn right", "turn left"],
+    "back and forth": ["forward 4", "backward 4", "forward 1"],
+    "lap of the grid": ["forward 15"],
+    "most of the way round": ["forward 13"],
+    "long backward": ["backward 20", "turn left", "backward 16"],
+    "top left corner": ["forward 7", "turn left", "forward 7"],
+    "wander then center": ["forward 3", "turn right", "forward 2", "center"],
+    "center twice": ["center", "center", "forward 1"],
+    "check in between": ["forward 2", "position", "forward 2"],
+    "go to 0 0": ["goto 0 0"],
+    "go to 14 14": ["goto 14 14"],
+    "visit corners": ["goto 0 0", "goto 14 0", "goto 14 14", "goto 0 14"],
+    "staircase": ["forward 1", "turn right", "forward 1", "turn left", "forward 1", "turn right", "forward 1",
+                  "turn left"],
+}
+
+
+def bench_compile(args):
+    compiler = PlanCompiler()
+    direction = 0
+    print(f"{'plan':<28} {'lines':>9} {'ticks':>9}")
+    for name, plan in SAMPLE_PLANS.items():
+        compiled = compiler.compile(plan, args.width, args.height, direction, args.obstacles)
+        ticks_in = plan_ticks(plan)
+        print(f"{name:<28} {len(plan):>4} -> {len(compiled):<3} {ticks_in:>4} -> {plan_ticks(compiled):<3}")
+
+    stats = compiler.stats
+    print(f"\n{stats['plans']} plans: {stats['lines_in']} -> {stats['lines_out']} lines "
+          f"({1 - stats['lines_out'] / stats['lines_in']:.0%} fewer round trips), "
+          f"{stats['ticks_in']} -> {stats['ticks_out']} ticks "
+          f"({1 - stats['ticks_out'] / stats['ticks_in']:.0%} less animation)")
+    print("(ticks exclude goto commands, whose paths are planned by the grid around its obstacles)")
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for plan in SAMPLE_PLANS.values():
+            compiler.compile(plan, args.width, args.height, direction, args.obstacles)
+    elapsed = time.perf_counter() - start
+    print(f"Compile time: {elapsed / (args.repeat * len(SAMPLE_PLANS)) * 1e6:.1f} us per plan")
+
+
+# Instructions as operators type them: the examples from the READMEs and the chat
+# loop, variations on them, and some that only the LLM can handle
+SAMPLE_INSTRUCTIONS = [
+    "Go forward 3 spaces",
+    "Turn right and move forward 2 steps",
+    "Turn left and move forward 2 steps",
+    "Where is the robot right now?",
+    "Put the robot back in the center",
+    "Go back to the center of the grid",
+    "Move forward a few steps and turn right",
+    "move in a square pattern where sides are 4",
+    "drive in a square with a side length of 10 spaces",
+    "Can you please move the robot forward one step?",
+    "turn around",
+    "turn left twice then go forward 5",
+    "back up 2 spaces",
+    "go to the top left corner",
+    "go to the bottom edge",
+    "go to (3, 4)",
+    "rotate 180 degrees",
+    "face left",
+    "face right",
+    "drive a 4 by 2 rectangle",
+    "what's your position?",
+    "move forward 3, turn right, move forward 3, turn right",
+    "go to the middle",
+    "zigzag across the grid",
+    "move forward until you reach the wall",
+    "make a figure eight",
+    "explore a little bit",
+    "go back to where you started",
+    "spiral outwards from the center",
+    "move diagonally up and to the right",
+]
+
+
+def bench_fastpath(args):
+    pose = (args.width // 2, args.height // 2, 0)
+    local = 0
+    for instruction in SAMPLE_INSTRUCTIONS:
+        commands = parse_intent(instruction, args.width, args.height, pose)
+        local += commands is not None
+        print(f"{instruction[:48]:<50} {', '.join(commands) if commands else '(LLM)'}"[:120])
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        for instruction in SAMPLE_INSTRUCTIONS:
+            parse_intent(instruction, args.width, args.height, pose)
+    parse_time = (time.perf_counter() - start) / (args.repeat * len(SAMPLE_INSTRUCTIONS))
+
+    print(f"\n{local} of {len(SAMPLE_INSTRUCTIONS)} instructions ({local / len(SAMPLE_INSTRUCTIONS):.0%}) "
+          f"parsed locally, {parse_time * 1e6:.1f} us per instruction")
+    print(f"With a {args.llm_ms:g} ms LLM call, the fast path saves {local * args.llm_ms / 1000:.1f}s over this corpus "
+          f"({local * args.llm_ms / len(SAMPLE_INSTRUCTIONS):.0f} ms per instruction on average)")
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def serve_fake_llm(delay, port_queue, calls, peak):
+    """A local OpenAI-compatible chat completions endpoint that answers with a random plan"""
+    from aiohttp import web
+
+    in_flight = 0
+
+    async def handle(request):
+        nonlocal in_flight
+        await request.json()
+        in_flight += 1
+        calls.value += 1
+        peak.value = max(peak.value, in_flight)
+        try:
+            await asyncio.sleep(delay)
+        finally:
+            in_flight -= 1
+        commands = [random.choice(["forward 2", "backward 1", "turn left", "turn right", "forward 5"])
+                    for _ in range(random.randint(1, 6))]
+        return web.json_response({
+            "id": f"fake-{calls.value}", "object": "chat.completion", "created": int(time.time()), "model": "fake",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": json.dumps({"commands": commands})}}],
+        })
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0, backlog=1024)
+    await site.start()
+    port_queue.put(site._server.sockets[0].getsockname()[1])
+    await asyncio.Event().wait()
+
+
+def run_fake_llm(delay, port_queue, calls, peak):
+    asyncio.run(serve_fake_llm(delay, port_queue, calls, peak))
+
+
+async def operator_session(port, session, instructions, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for index in range(instructions):
+        start = time.perf_counter()
+        # Unique instructions so every one of them goes to the LLM
+        writer.write(f"session {session} step {index}: move around a bit\n".encode())
+        result = json.loads(await reader.readline())
+        if "error" in result:
+            raise RuntimeError(result["error"])
+        latencies.append(time.perf_counter() - start)
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_service_load(args, llm_port):
+    # The service reads its configuration from chat.py, which needs an API key to import
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    from plan_cache import PlanCache
+    from service import ControllerService, make_llm_client
+
+    service = ControllerService(
+        args.grid_host, args.grid_port,
+        llm_client=make_llm_client(args.max_llm_calls, base_url=f"http://127.0.0.1:{llm_port}/v1",
+                                   api_key="fake", max_retries=0),
+        plan_cache=PlanCache(), max_llm_calls=args.max_llm_calls, llm_rate=args.llm_rate, pool_size=args.pool_size)
+    port = await service.start("127.0.0.1", 0)
+
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(operator_session(port, session, args.instructions, latencies)
+                           for session in range(args.sessions)))
+    elapsed = time.perf_counter() - start
+    await service.stop()
+    return service, latencies, elapsed
+
+
+def bench_service(args):
+    """Concurrent operator sessions against the controller service and a fake LLM"""
+    # The fake LLM runs in its own process so it doesn't compete with the service for CPU
+    port_queue = multiprocessing.Queue()
+    calls, peak = multiprocessing.Value("i", 0), multiprocessing.Value("i", 0)
+    llm = multiprocessing.Process(target=run_fake_llm, args=(args.llm_ms / 1000, port_queue, calls, peak), daemon=True)
+    llm.start()
+    try:
+        service, latencies, elapsed = asyncio.run(run_service_load(args, port_queue.get(timeout=10)))
+    except OSError as e:
+        print(f"Could not reach the RobotGrid on {args.grid_host}:{args.grid_port}: {e}")
+        print("Start one first, e.g. python RobotGrid/grid.py --headless --tick-ms 0 --robots 100")
+        return
+    finally:
+        llm.terminate()
+    total = args.sessions * args.instructions
+    print(f"{args.sessions} sessions x {args.instructions} instructions on {service.robots} robots "
+          f"in {elapsed:.2f}s (LLM {args.llm_ms:g} ms, at most {args.max_llm_calls} concurrent, {args.llm_rate:g}/s)")
+    print(f"sessions/s: {args.sessions / elapsed:.1f}  instructions/s: {total / elapsed:.1f}")
+    print(f"latency: p50 {percentile(latencies, 50) * 1000:.1f} ms  p99 {percentile(latencies, 99) * 1000:.1f} ms  "
+          f"max {max(latencies) * 1000:.1f} ms")
+    print(f"LLM calls: {calls.value}, peak concurrency {peak.value}")
+    print(f"a serial chat loop would need at least {total * args.llm_ms / 1000:.1f}s for the LLM calls alone")
+
+
+def synthetic_trace(count):
+    """A trace of the sample instructions, answering the ones the LLM gets with the sample plans"""
+    plans = list(SAMPLE_PLANS.values())
+    return [{"instruction": SAMPLE_INSTRUCTIONS[index % len(SAMPLE_INSTRUCTIONS)],
+             "llm": json.dumps({"commands": plans[index % len(plans)]})} for index in range(count)]
+
+
+@contextlib.contextmanager
+def headless_grid(robots=1):
+    """Start a headless RobotGrid on a free port that steps as fast as it can; yields the port"""
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "RobotGrid", "grid.py")
+    grid = subprocess.Popen([sys.executable, "-u", script, "--headless", "--tick-ms", "0", "--port", "0",
+                             "--robots", str(robots)], stdout=subprocess.PIPE, text=True)
+    try:
+        line = grid.stdout.readline()
+        match = re.search(r"listening on [^:]+:(\d+)", line)
+        if match is None:
+            raise RuntimeError(f"RobotGrid did not start: {line.strip() or 'no output'}")
+        yield int(match.group(1))
+    finally:
+        grid.terminate()
+        grid.wait()
+
+
+def bench_replay(args):
+    """Replay a trace through a fresh headless grid and a stubbed LLM at full speed"""
+    records = load_trace(args.trace) if args.trace else synthetic_trace(args.instructions)
+    if not records:
+        print("The trace is empty")
+        return
+    # chat.py needs an API key to import, and changes to its own directory
+    os.environ.setdefault("OPENAI_API_KEY", "fake")
+    from chat import RobotController
+    from plan_cache import PlanCache
+
+    llm = ReplayLLM(args.llm_ms / 1000)
+    with contextlib.ExitStack() as stack:
+        port = args.grid_port or stack.enter_context(headless_grid())
+        controller = RobotController("127.0.0.1", port, llm_client=llm, plan_cache=PlanCache(),
+                                     stream=args.stream, trace_path=None)
+        # The controller narrates every command; only the summary is of interest here
+        stack.enter_context(contextlib.redirect_stdout(open(os.devnull, "w")))
+        start = time.perf_counter()
+        results = replay(records, controller, llm)
+        elapsed = time.perf_counter() - start
+        controller.connection.close()
+        if controller.subscription is not None:
+            controller.subscription.close()
+
+    latencies = [result["timings"]["total"] for result in results]
+    commands = sum(len(result["commands"]) for result in results)
+    sources = Counter(result["source"] for result in results)
+    print(f"{len(results)} instructions in {elapsed:.2f}s ({'streaming' if args.stream else 'batch'} mode, "
+          f"LLM {args.llm_ms:g} ms): {len(results) / elapsed:.1f} instructions/s, {commands / elapsed:.1f} commands/s")
+    print(f"latency: p50 {percentile(latencies, 50):.2f} ms  p90 {percentile(latencies, 90):.2f} ms  "
+          f"p99 {percentile(latencies, 99):.2f} ms  max {max(latencies):.2f} ms")
+    phases = list(dict.fromkeys(name for result in results for name in result["timings"] if name != "total"))
+    print("mean per phase: " + ", ".join(
+        f"{name} {statistics.mean(result['timings'].get(name, 0.0) for result in results):.3f} ms" for name in phases))
+    print("plans: " + ", ".join(f"{count} {source}" for source, count in sources.most_common()) +
+          f" ({llm.calls} LLM calls)")
+    diverged = sum(result["diverged"] for result in results)
+    if diverged:
+        print(f"{diverged} instructions dispatched different commands than recorded "
+              "(the trace was recorded in the other mode, or from another pose or grid size)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LLMController benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    compile_plans = subparsers.add_parser("compile", help="lines and ticks saved by the plan compiler")
+    compile_plans.add_argument("--width", type=int, default=15)
+    compile_plans.add_argument("--height", type=int, default=15)
+    compile_plans.add_argument("--obstacles", action="store_true",
+                               help="compile for a grid with obstacles, where moves can't be reduced or cancelled")
+    compile_plans.add_argument("--repeat", type=int, default=1000, help="passes over the corpus for timing")
+    compile_plans.set_defaults(func=bench_compile)
+
+    fastpath = subparsers.add_parser("fastpath", help="instructions parsed locally instead of by the LLM")
+    fastpath.add_argument("--width", type=int, default=15)
+    fastpath.add_argument("--height", type=int, default=15)
+    fastpath.add_argument("--repeat", type=int, default=1000, help="passes over the corpus for timing")
+    fastpath.add_argument("--llm-ms", type=float, default=1500, help="typical LLM response time to compare with")
+    fastpath.set_defaults(func=bench_fastpath)
+
+    replay_trace = subparsers.add_parser("replay", help="replay a recorded trace through a headless grid")
+    replay_trace.add_argument("trace", nargs="?", help="trace file recorded with TRACE_PATH "
+                              "(default: a synthetic trace of sample instructions)")
+    replay_trace.add_argument("--instructions", type=int, default=1000, help="length of the synthetic trace")
+    replay_trace.add_argument("--llm-ms", type=float, default=0, help="response time of the stubbed LLM")
+    replay_trace.add_argument("--stream", action="store_true", help="replay with STREAM_COMMANDS behaviour")
+    replay_trace.add_argument("--grid-port", type=int, help="use a running grid instead of starting a headless one")
+    replay_trace.set_defaults(func=bench_replay)
+
+    service = subparsers.add_parser("service", help="concurrent sessions against the controller service")
+    service.add_argument("--sessions", type=int, default=200)
+    service.add_argument("--instructions", type=int, default=5, help="instructions sent by each session in turn")
+    service.add_argument("--llm-ms", type=float, default=200, help="response time of the fake LLM")
+    service.add_argument("--max-llm-calls", type=int, default=64)
+    service.add_argument("--llm-rate", type=float, default=1000, help="LLM calls started per second")
+    service.add_argument("--pool-size", type=int, default=8, help="connections to the RobotGrid")
+    service.add_argument("--grid-host", default="127.0.0.1")
+    service.add_argument("--grid-port", type=int, default=12345)
+    service.set_defaults(func=bench_service)
+
+    args = parser.parse_args()
+    if getattr(args, "trace", None):
+        args.trace = os.path.abspath(args.trace)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,14 +2,37 @@ import os
 import socket
 import json
 import sys
+import time
 from openai import OpenAI
 from dotenv import load_dotenv
+from grid_client import GridConnection, GridSubscription
+from intent_parser import needs_pose, parse_intent
+from plan_cache import PlanCache
+from streaming import CommandStreamParser
+from pose_tracker import PoseTracker
+from plan_compiler import PlanCompiler, plan_direction
+from timings import LatencyRecorder
+from tracing import TraceRecorder
 
 load_dotenv()
 
 API_KEY = os.getenv("OPENAI_API_KEY")
 MODEL = os.getenv("OPENAI_MODEL")
 
+# Plan cache: repeated instructions are answered locally without an LLM call
+PLAN_CACHE_SIZE = int(os.getenv("PLAN_CACHE_SIZE", "256"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", str(24 * 3600)))  # seconds
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH")  # optional JSON file to persist the cache
+
+# Stream the LLM response and start moving the robot before the whole plan has arrived
+STREAM_COMMANDS = os.getenv("STREAM_COMMANDS", "false").lower() in ("1", "true", "yes")
+
+# Optional JSON Lines file every instruction is recorded to, for replaying with benchmark.py
+TRACE_PATH = os.getenv("TRACE_PATH")
+
+# Seconds to wait for the robot to finish its queue when a plan needs its pose
+POSE_WAIT = float(os.getenv("POSE_WAIT", "30"))
+
 # Initialize the OpenAI client
 client = OpenAI(api_key=API_KEY)
 
@@ -20,164 +43,414 @@ TCP_PORT = 12345        # The port used by the server (matching RobotGrid)
 # set working directory to the directory of the file
 os.chdir(os.path.dirname(os.path.abspath(__file__)))
 
+def validate_command(line):
+    """Return the command if it matches a valid command pattern, otherwise None"""
+    line = line.strip()
+    if line in ["turn left", "turn right", "position", "center"]:
+        return line
+    elif line.startswith("forward ") or line.startswith("backward "):
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            return line
+    elif line.startswith("goto "):
+        parts = line.split()
+        if len(parts) == 3 and parts[1].isdigit() and parts[2].isdigit():
+            return line
+    return None
+
+def to_server_command(command):
+    """Translate an LLM command into the server protocol"""
+    if command.lower() == "position":
+        # The server expects GET_POSITION
+        return "GET_POSITION"
+    elif command.lower() == "center":
+        return "CENTER"
+    # Normal commands: FORWARD n, BACKWARD n, TURN LEFT, TURN RIGHT
+    return " ".join(command.strip().split()).upper()
+
 class RobotController:
-    def __init__(self, host=TCP_HOST, port=TCP_PORT):
+    def __init__(self, host=TCP_HOST, port=TCP_PORT, llm_client=None, plan_cache=None, stream=STREAM_COMMANDS,
+                 trace_path=TRACE_PATH):
         self.host = host
         self.port = port
+        self.connection = GridConnection(host, port)
+        # Robot 0's state pushed by the grid, to resync the tracked pose; None if it can't be subscribed to
+        self.subscription = GridSubscription(host, port)
+        self.llm_client = llm_client or client
+        self.plan_cache = plan_cache or PlanCache(PLAN_CACHE_SIZE, PLAN_CACHE_TTL, PLAN_CACHE_PATH)
+        self.tracker = PoseTracker()
+        self.compiler = PlanCompiler()
+        self.latency = LatencyRecorder()
+        self.stream = stream
+        self.trace = TraceRecorder(trace_path) if trace_path else None
+        self.record = None  # Trace record of the instruction being handled
+        self.fast_path_hits = 0
+        self.fast_path_misses = 0
+        self.fast_path_time = 0.0  # Seconds spent parsing locally
 
         # Initialize OpenAI with the older pattern that's more compatible
         if not API_KEY:
             print("Warning: OPENAI_API_KEY not set in .env file")
 
-        # System prompt for the LLM
+        # System prompt for the LLM; it never changes, so providers can cache it as a prompt prefix
         with open("system_prompt.md", "r") as file:
-            self.system_prompt_template = file.read()
+            self.system_prompt = file.read()
+
+    def sync_pose(self, timeout=0):
+        """Resync the tracked pose from the states the grid has pushed since the last instruction.
+
+        If the pose is unknown, waits up to `timeout` seconds for the robot to
+        finish its queue.
+        """
+        if self.subscription is None:
+            return
+        try:
+            self.subscription.connect()
+        except OSError as e:
+            print(f"Could not subscribe to robot updates, querying the pose instead: {e}")
+            self.subscription = None
+            return
+        deadline = time.monotonic() + timeout
+        while True:
+            for _, x, y, direction, queued, completed in self.subscription.poll():
+                self.tracker.observe(x, y, direction, queued, completed)
+            remaining = deadline - time.monotonic()
+            if self.tracker.pose is not None or remaining <= 0 or not self.subscription.wait(remaining):
+                return
+
+    def fast_path(self, user_input):
+        """Translate simple instructions locally; returns the plan, or None to ask the LLM"""
+        self.get_dimensions()
+        start = time.perf_counter()
+        with self.latency.phase("parse"):
+            commands = parse_intent(user_input, self.tracker.width, self.tracker.height, self.tracker.partial_pose)
+            pending = commands is None and needs_pose(user_input, self.tracker.width, self.tracker.height,
+                                                      self.tracker.partial_pose)
+        self.fast_path_time += time.perf_counter() - start
+        if pending:
+            # Edges, corners and headings are resolved from the pose, so only these wait for the robot to stop
+            self.get_current_position()
+            commands = parse_intent(user_input, self.tracker.width, self.tracker.height, self.tracker.partial_pose)
+        if commands is None:
+            self.fast_path_misses += 1
+            return None
+        self.fast_path_hits += 1
+        self.note(source="local")
+        print("(plan parsed locally)")
+        return "\n".join(commands)
+
+    def lookup_plan(self, user_input, wait=True):
+        """Check the plan cache; returns (cached plan or None, the pose it is keyed on or None)
+
+        Relative instructions are cached without the pose, so a hit on one
+        needs no round trip at all. Instructions about absolute places wait
+        for the pose if `wait` is set; otherwise they skip the cache while it
+        is unknown.
+        """
+        if self.plan_cache.depends_on_pose(user_input) and wait:
+            self.get_current_position()
+        current_position = self.tracker.describe() if self.tracker.pose is not None else None
+        cached_plan = self.plan_cache.get(user_input, current_position)
+        if cached_plan is not None:
+            self.note(source="cache")
+            print("(plan from cache)")
+        return cached_plan, current_position
+
+    def build_messages(self, user_input):
+        # The static instructions come first and the pose, as far as it is known, goes in a small trailing message
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": f"The robot is currently at this position: {self.tracker.describe()}"},
+            {"role": "user", "content": user_input}
+        ]
 
     def process_request(self, user_input):
         """Process natural language input using the LLM and convert to robot commands"""
+        local_plan = self.fast_path(user_input)
+        if local_plan is not None:
+            return self.compile_plan(local_plan)
 
-                # Replace the {current_position} placeholder with the actual current position
-        current_position = self.get_current_position()
-        system_prompt = self.system_prompt_template.replace("{current_position}", current_position) 
-
+        cached_plan, current_position = self.lookup_plan(user_input)
+        if cached_plan is not None:
+            return self.compile_plan(cached_plan)
 
         try:
             # Get response from LLM using the legacy pattern
-            response = client.chat.completions.create(model=MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_input}
-            ],
-            response_format={"type": "json_object"})
+            with self.latency.phase("llm"):
+                response = self.llm_client.chat.completions.create(model=MODEL,
+                messages=self.build_messages(user_input),
+                response_format={"type": "json_object"})
 
             # Extract the commands from the JSON response
             json_response = response.choices[0].message.content.strip()
+            self.note(source="llm", llm=json_response)
                 
             commands = json.loads(json_response)["commands"]
 
             # Validate that the response contains valid commands
-            valid_commands = []
-            for line in commands:
-                line = line.strip()
-                if not line:
-                    continue
-
-                # Check if line matches a valid command pattern
-                valid = False
-                if line in ["turn left", "turn right", "position", "center"]:
-                    valid = True
-                elif line.startswith("forward ") or line.startswith("backward "):
-                    parts = line.split()
-                    if len(parts) == 2 and parts[1].isdigit():
-                        valid = True
-
-                if valid:
-                    valid_commands.append(line)
+            valid_commands = [command for command in map(validate_command, commands) if command]
 
             # Join valid commands back into a response
             final_response = "\n".join(valid_commands)
+            if final_response:
+                self.plan_cache.put(user_input, current_position, final_response)
 
-            # Return the valid commands
-            return final_response
+            # Return the valid commands, compiled to the shortest equivalent plan
+            return self.compile_plan(final_response)
         except Exception as e:
             print(f"Error calling LLM API: {e}")
             return "position"  # Fallback to a safe command
 
-    def send_command(self, command):
-        """Send a command to the TCP server and return the response"""
-        # Create a new connection for each command since the server disconnects after each one
+    def stream_request(self, user_input):
+        """Stream the LLM response and dispatch each command as soon as its string closes.
+
+        Generation overlaps with execution: the robot starts moving on the
+        first command while the rest of the plan is still being generated.
+        Returns (commands, results) formatted like process_request and
+        execute_commands.
+        """
+        local_plan = self.fast_path(user_input)
+        if local_plan is not None:
+            plan = self.compile_plan(local_plan)
+            return plan, self.execute_commands(plan)
+
+        # The stream never waits for the robot to stop; the LLM gets the pose as far as it is known
+        cached_plan, current_position = self.lookup_plan(user_input, wait=False)
+        if cached_plan is not None:
+            plan = self.compile_plan(cached_plan)
+            return plan, self.execute_commands(plan)
+
+        parser = CommandStreamParser()
+        chunks = []
+        generated = []
+        dispatched = []
+        # Direction after everything dispatched so far, for compiling each command as it arrives
+        direction = self.tracker.direction
         try:
-            # Create a new socket for this command
-            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            s.settimeout(5)
-            s.connect((self.host, self.port))
-
-            # Handle special commands
-            if command.lower() == "position":
-                # The server expects GET_POSITION
-                s.sendall("GET_POSITION\n".encode())
-                response = s.recv(1024).decode().strip()
-
-                # Close the socket
-                s.close()
-
-                try:
-                    parts = response.split()
-                    if len(parts) >= 3:
-                        x, y, dir_val = int(parts[0]), int(parts[1]), int(parts[2])
-                        direction = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}.get(dir_val, str(dir_val))
-                        return f"Position: ({x}, {y}), Facing: {direction}"
-                    else:
-                        return f"Invalid position data: {response}"
-                except Exception as e:
-                    print(f"Error parsing position: {e}")
-                    return f"Raw position data: {response}"
-
-            elif command.lower() == "center":
-                print("Centering robot...")
-                s.sendall("CENTER\n".encode())
-                response = s.recv(1024).decode().strip()
-                s.close()
-                return "Robot centered"
-
-            else:
-                # Normal commands: FORWARD n, BACKWARD n, TURN LEFT, TURN RIGHT
-                parts = command.strip().split()
-                server_command = " ".join(parts).upper()
+            with self.latency.phase("llm"):
+                stream = self.llm_client.chat.completions.create(model=MODEL,
+                messages=self.build_messages(user_input),
+                response_format={"type": "json_object"},
+                stream=True)
+
+                for chunk in stream:
+                    if not chunk.choices or not chunk.choices[0].delta.content:
+                        continue
+                    chunks.append(chunk.choices[0].delta.content)
+                    for line in parser.feed(chunk.choices[0].delta.content):
+                        command = validate_command(line)
+                        if command is None:
+                            continue
+                        generated.append(command)
+                        # Commands can't be coalesced without waiting for the next one, but
+                        # moves around the torus are still reduced on the fly
+                        compiled = self.compiler.compile([command], self.tracker.width, self.tracker.height,
+                                                         direction, self.tracker.obstacles)
+                        direction = plan_direction(direction, compiled)
+                        for command in compiled:
+                            print(f"Executing: {command}")
+                        # Replies are collected once the stream ends
+                        self.connection.send([self.to_server_command(command) for command in compiled])
+                        if compiled:
+                            self.latency.mark("first_command")
+                        dispatched += compiled
+        except Exception as e:
+            print(f"Error during streaming request: {e}")
+            if not dispatched:
+                return "position", self.execute_commands("position")  # Fallback to a safe command
+        finally:
+            self.note(source="llm", llm="".join(chunks))
 
+        plan = "\n".join(dispatched)
+        try:
+            with self.latency.phase("dispatch"):
+                responses = self.connection.receive(len(dispatched))
+            self.track(dispatched, responses)
+            self.note_dispatch(dispatched, responses)
+            results = [self.format_response(command, response) for command, response in zip(dispatched, responses)]
+        except Exception as e:
+            print(f"Error reading responses: {e}")
+            self.tracker.invalidate()
+            results = [f"Error: {e}"] * len(dispatched)
+        if generated and parser.done:
+            self.plan_cache.put(user_input, current_position, "\n".join(generated))
+        return plan, '\n'.join(f"{command} → {result}" for command, result in zip(dispatched, results))
+
+    def compile_plan(self, plan):
+        """Run a validated plan through the peephole compiler using the tracked direction"""
+        commands = [command for command in plan.split("\n") if command.strip()]
+        compiled = self.compiler.compile(commands, self.tracker.width, self.tracker.height, self.tracker.direction,
+                                         self.tracker.obstacles)
+        if len(compiled) < len(commands):
+            print(f"(plan compiled from {len(commands)} to {len(compiled)} commands)")
+        return "\n".join(compiled)
+
+    def to_server_command(self, command):
+        return to_server_command(command)
+
+    def format_response(self, command, response):
+        """Turn a raw server reply into a readable result"""
+        if command.lower() == "position":
+            try:
+                parts = response.split()
+                if len(parts) >= 3:
+                    x, y, dir_val = int(parts[0]), int(parts[1]), int(parts[2])
+                    direction = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}.get(dir_val, str(dir_val))
+                    return f"Position: ({x}, {y}), Facing: {direction}"
+                else:
+                    return f"Invalid position data: {response}"
+            except Exception as e:
+                print(f"Error parsing position: {e}")
+                return f"Raw position data: {response}"
+        elif command.lower() == "center":
+            return "Robot centered"
+        if response:
+            return response
+        else:
+            return "Command executed"
+
+    def pipeline_commands(self, commands):
+        # The server keeps the session open, so the whole batch goes out in a
+        # single write and the replies come back in order on the same socket
+        try:
+            server_commands = [self.to_server_command(command) for command in commands]
+            for server_command in server_commands:
                 print(f"Sending command: '{server_command}'")
-                s.sendall(f"{server_command}\n".encode())
-                response = s.recv(1024).decode().strip()
-                s.close()
+            responses = self.connection.pipeline(server_commands)
+            for response in responses:
                 print(f"Response: '{response}'")
-
-                if response:
-                    return response
+            self.track(commands, responses)
+            self.note_dispatch(commands, responses)
+            return [self.format_response(command, response) for command, response in zip(commands, responses)]
+        except Exception:
+            # We no longer know which commands were applied
+            self.tracker.invalidate()
+            raise
+
+    def track(self, commands, responses):
+        """Keep the locally tracked pose in step with acknowledged commands"""
+        for command, response in zip(commands, responses):
+            try:
+                if command.lower() == "position":
+                    # The reply is where the robot is now, possibly partway through its queue,
+                    # so the pose is left to the states the grid pushes
+                    continue
+                elif response == "OK":
+                    self.tracker.apply(command)
                 else:
-                    return "Command executed"
-
+                    # The grid didn't take the command as sent; ask it where the robot is
+                    self.tracker.invalidate()
+            except ValueError:
+                self.tracker.invalidate()
+
+    def note(self, **fields):
+        """Add fields to the trace record of the current instruction"""
+        if self.record is not None:
+            self.record.update(fields)
+
+    def note_dispatch(self, commands, responses):
+        if self.record is not None:
+            self.record["commands"] += commands
+            self.record["replies"] += responses
+
+    def send_commands(self, commands):
+        """Pipeline a batch of commands over the pooled connection and return one result per command"""
+        try:
+            return self.pipeline_commands(commands)
         except ConnectionRefusedError:
             print(f"Connection refused: Make sure the RobotGrid application is running on {self.host}:{self.port}")
-            return "Error: Connection refused"
+            return ["Error: Connection refused"] * len(commands)
         except socket.timeout:
             print(f"Connection timed out: Could not connect to {self.host}:{self.port}")
-            return "Error: Connection timeout"
+            return ["Error: Connection timeout"] * len(commands)
         except Exception as e:
             print(f"Error sending command: {e}")
-            return f"Error: {e}"
+            return [f"Error: {e}"] * len(commands)
+
+    def send_command(self, command):
+        """Send a command to the TCP server and return the response"""
+        return self.send_commands([command])[0]
 
     def execute_commands(self, commands):
         """Execute a list of robot commands and return the results"""
-        results = []
-
-        # Process each command
-        for command in commands.split('\n'):
-            command = command.strip()
-            if not command:
-                continue
-
+        commands = [command.strip() for command in commands.split('\n') if command.strip()]
+        for command in commands:
             print(f"Executing: {command}")
-            result = self.send_command(command)
-            results.append(f"{command} → {result}")
 
-        return '\n'.join(results)
+        # Send the whole plan as one pipelined batch
+        with self.latency.phase("dispatch"):
+            results = self.send_commands(commands)
+        return '\n'.join(f"{command} → {result}" for command, result in zip(commands, results))
 
     def get_current_position(self):
-        """Get the current position of the robot"""
-        return self.send_command("position")
+        """Get the current position of the robot, from the local tracker when it is in sync.
+
+        An unknown pose is taken from the robot's state once it has run every
+        command sent so far, or queried from the grid if that doesn't come.
+        """
+        self.get_dimensions()
+        with self.latency.phase("pose"):
+            if self.tracker.pose is None:
+                self.sync_pose(POSE_WAIT)
+            if self.tracker.pose is None:
+                try:
+                    self.tracker.set_position(self.connection.pipeline(["GET_POSITION"])[0])
+                except Exception as e:
+                    print(f"Error getting position: {e}")
+                    return f"Error: {e}"
+            return self.tracker.describe()
+
+    def get_dimensions(self):
+        """Query the grid size once; it never changes while the grid runs"""
+        if self.tracker.width is None:
+            with self.latency.phase("pose"):
+                try:
+                    self.tracker.set_dimensions(self.connection.pipeline(["GET_DIMENSIONS"])[0])
+                except Exception as e:
+                    print(f"Error getting grid dimensions: {e}")
+
+    def handle_instruction(self, user_input):
+        """Plan and execute one instruction; returns its trace record"""
+        self.latency.start()
+        self.record = {"time": time.time(), "instruction": user_input,
+                       "pose": list(self.tracker.pose) if self.tracker.pose is not None else None,
+                       "source": None, "llm": None, "commands": [], "replies": []}
+        try:
+            self.sync_pose()
+            if self.stream:
+                # Commands are dispatched while the response is still streaming in
+                commands, results = self.stream_request(user_input)
+                print("\n🤖 Executed commands:")
+                print(commands)
+                print("\n📡 Robot responses:")
+                print(results)
+            else:
+                commands = self.process_request(user_input)
+                print("\n🤖 Executing commands:")
+                print(commands)
+
+                # Execute the commands
+                print("\n📡 Robot responses:")
+                results = self.execute_commands(commands)
+                print(results)
+        finally:
+            timings = self.latency.finish()
+            record, self.record = self.record, None
+            record["timings"] = {name: round(seconds * 1000, 3) for name, seconds in timings.items()}
+            if self.trace is not None:
+                self.trace.write(record)
+        return record
 
     def run_chat_loop(self):
         """Run the main chat loop"""
         print("🤖 Robot Chat Controller 🤖")
         print("Type 'exit' or 'quit' to end the session.")
         print("Type 'help' to see available direct commands.")
+        print("Type 'stats' to see plan cache and latency statistics.")
 
-        # Test if we can connect to the server
+        # Test if we can connect to the server; the connection stays open for the session
         try:
-            test_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            test_socket.settimeout(5)
-            test_socket.connect((self.host, self.port))
-            test_socket.close()
+            self.connection.connect()
             print(f"RobotGrid server is available at {self.host}:{self.port}")
         except Exception as e:
             print("\n❌ Could not connect to the RobotGrid application.")
@@ -208,17 +481,14 @@ class RobotController:
                 # Check for exit command
                 if user_input.lower() in ['exit', 'quit']:
                     break
+                if user_input.lower() == 'stats':
+                    self.print_stats()
+                    continue
 
                 # Process natural language with LLM
                 print("\n🔄 Processing your request...")
-                commands = self.process_request(user_input)
-                print("\n🤖 Executing commands:")
-                print(commands)
-
-                # Execute the commands
-                print("\n📡 Robot responses:")
-                results = self.execute_commands(commands)
-                print(results)
+                self.handle_instruction(user_input)
+                print(f"\n⏱️  {self.latency.format(self.latency.history[-1])}")
 
             except KeyboardInterrupt:
                 break
@@ -226,8 +496,32 @@ class RobotController:
                 print(f"Error: {e}")
                 # Don't break, try again
 
+        self.connection.close()
+        if self.subscription is not None:
+            self.subscription.close()
+        if self.trace is not None:
+            self.trace.close()
+        self.print_stats()
         print("Session ended. Goodbye!")
 
+    def print_stats(self):
+        stats = self.plan_cache.stats()
+        print(f"Plan cache: {stats['hits']} hits, {stats['misses']} misses "
+              f"({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries, {stats['evictions']} evictions")
+        print(f"Latency: {self.latency.summary()}")
+        instructions = self.fast_path_hits + self.fast_path_misses
+        if instructions:
+            # LLM round trips avoided, valued at the mean time of the ones that were made
+            llm_times = [timings["llm"] for timings in self.latency.history if timings.get("llm")]
+            saved = self.fast_path_hits * sum(llm_times) / len(llm_times) if llm_times else 0.0
+            print(f"Fast path: {self.fast_path_hits} of {instructions} instructions "
+                  f"({self.fast_path_hits / instructions:.0%}) parsed locally in "
+                  f"{self.fast_path_time / instructions * 1e6:.0f} us on average, saving about {saved:.1f}s of LLM time")
+        stats = self.compiler.stats
+        if stats["plans"]:
+            print(f"Plan compiler: {stats['lines_in']} -> {stats['lines_out']} lines, "
+                  f"{stats['ticks_in']} -> {stats['ticks_out']} ticks over {stats['plans']} plans")
+
 if __name__ == "__main__":
     controller = RobotController()
     controller.run_chat_loop() 
\ No newline at end of file
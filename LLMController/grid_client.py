@@ -0,0 +1,344 @@
+import asyncio
+import select
+import socket
+from contextlib import asynccontextmanager
+
+
+class GridConnection:
+    """A persistent connection to the RobotGrid server.
+
+    The server keeps a session open for as long as the client does, so one
+    socket is reused for every command. Commands can be pipelined: a whole
+    batch is written at once and the replies are read back in order.
+    """
+
+    def __init__(self, host, port, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        self.pending = 0  # Replies sent for but not read yet
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.pending = 0
+            self.reader = self.sock.makefile("rb")
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.reader.close()
+                self.sock.close()
+            finally:
+                self.sock = None
+                self.reader = None
+
+    def _readline(self):
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by RobotGrid server")
+        return line.decode().strip()
+
+    def _dropped(self):
+        """True if the server has closed an idle connection, or sent something unasked, since its last use"""
+        if self.pending:
+            return False  # Replies still to be read make the socket readable
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return bool(readable)
+
+    def _send(self, payload):
+        """Write a batch, reconnecting once if a reused socket turns out to be dead.
+
+        A socket is only retried when writing to it fails, before the server
+        can have read any of the batch. Once the batch is sent nothing is
+        resent, so commands never run twice.
+        """
+        if self.sock is not None and self._dropped():
+            self.close()
+        reused = self.sock is not None
+        self.connect()
+        try:
+            self.sock.sendall(payload)
+        except socket.timeout:
+            # Part of the batch may have been sent already
+            self.close()
+            raise
+        except OSError:
+            self.close()
+            if not reused:
+                raise
+            self.connect()
+            try:
+                self.sock.sendall(payload)
+            except OSError:
+                self.close()
+                raise
+
+    def pipeline(self, commands):
+        """Send every command in one write and return the replies in order"""
+        commands = [command.strip() for command in commands if command.strip()]
+        if not commands:
+            return []
+        self._send("".join(f"{command}\n" for command in commands).encode())
+        self.pending += len(commands)
+        return self.receive(len(commands))
+
+    def send(self, commands):
+        """Write commands without waiting for their replies; collect them later with `receive`"""
+        payload = "".join(f"{command.strip()}\n" for command in commands if command.strip()).encode()
+        if payload:
+            self._send(payload)
+            self.pending += payload.count(b"\n")
+
+    def receive(self, count):
+        """Read the replies to `count` commands previously written with `send`"""
+        try:
+            replies = [self._readline() for _ in range(count)]
+            self.pending -= count
+            return replies
+        except (ConnectionError, OSError):
+            self.close()
+            raise
+
+    def request(self, command):
+        """Send a single command and return its reply"""
+        return self.pipeline([command])[0]
+
+    def __enter__(self):
+        return self.connect()
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class GridSubscription:
+    """Pushed state of one robot, on a connection of its own.
+
+    The server sends an `EVENT <tick> R<robot> <x> <y> <direction> <queued>
+    <completed>` line whenever the robot changes, coalescing fast ticks, so
+    the latest event is always current. Keeping the subscription off the
+    command connection keeps events out of the command replies. `connect`
+    waits for the event describing the robot as it is when subscribing.
+    """
+
+    def __init__(self, host, port, robot=0, timeout=5):
+        self.host = host
+        self.port = port
+        self.robot = robot
+        self.timeout = timeout
+        self.sock = None
+        self.buffer = b""
+        self.events = []
+
+    def connect(self):
+        if self.sock is None:
+            self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            self.buffer = b""
+            try:
+                self.sock.sendall(f"R{self.robot} SUBSCRIBE\n".encode())
+                while not self.events:
+                    self._receive(self.sock.recv(65536))
+            except OSError:
+                self.close()
+                raise
+        return self
+
+    def close(self):
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            finally:
+                self.sock = None
+
+    def _receive(self, data):
+        if not data:
+            raise ConnectionError("Connection closed by RobotGrid server")
+        lines = (self.buffer + data).split(b"\n")
+        self.buffer = lines.pop()
+        for line in lines:
+            parts = line.split()
+            if parts[:1] == [b"EVENT"] and len(parts) == 8:
+                # (tick, x, y, direction, queued, completed)
+                self.events.append(tuple(map(int, parts[1:2] + parts[3:])))
+
+    def poll(self):
+        """Events received since the last poll, oldest first, without blocking"""
+        try:
+            while self.sock is not None and select.select([self.sock], [], [], 0)[0]:
+                self._receive(self.sock.recv(65536))
+        except OSError:
+            self.close()
+        events, self.events = self.events, []
+        return events
+
+    def wait(self, timeout):
+        """Block until an event arrives or `timeout` seconds pass; returns False on timeout"""
+        if self.sock is None:
+            return False
+        return bool(select.select([self.sock], [], [], timeout)[0])
+
+
+class AsyncGridSubscription:
+    """Pushed states of any number of robots on one asyncio connection.
+
+    `subscribe` adds a robot; a reader task passes each of its states to
+    `on_event(robot, x, y, direction, queued, completed)` as it arrives,
+    starting with the robot's state when it was subscribed to.
+    """
+
+    def __init__(self, host, port, on_event, timeout=5):
+        self.host = host
+        self.port = port
+        self.on_event = on_event
+        self.timeout = timeout
+        self.writer = None
+        self.reader_task = None
+        self.connecting = asyncio.Lock()
+
+    async def connect(self):
+        async with self.connecting:
+            if self.writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), self.timeout)
+                self.writer = writer
+                self.reader_task = asyncio.create_task(self.read_events(reader, writer))
+        return self
+
+    async def subscribe(self, robot):
+        """Subscribe to a robot; if it already is, resubscribe so its current state is sent again"""
+        await self.connect()
+        self.writer.write(f"R{robot} UNSUBSCRIBE\nR{robot} SUBSCRIBE\n".encode())
+        await asyncio.wait_for(self.writer.drain(), self.timeout)
+
+    async def read_events(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.split()
+                # EVENT <tick> R<robot> <x> <y> <direction> <queued> <completed>; replies to SUBSCRIBE are skipped
+                if parts[:1] == [b"EVENT"] and len(parts) == 8:
+                    self.on_event(int(parts[2][1:]), *map(int, parts[3:]))
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            if self.writer is writer:
+                self.writer = None
+
+    async def close(self):
+        if self.reader_task is not None:
+            self.reader_task.cancel()
+            try:
+                await self.reader_task
+            except asyncio.CancelledError:
+                pass
+            self.reader_task = None
+
+
+class AsyncGridConnection:
+    """The asyncio counterpart of GridConnection, on asyncio streams"""
+
+    def __init__(self, host, port, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.reader = None
+        self.writer = None
+
+    async def connect(self):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+        return self
+
+    async def close(self):
+        if self.writer is not None:
+            writer, self.reader, self.writer = self.writer, None, None
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def _readline(self):
+        line = await asyncio.wait_for(self.reader.readline(), self.timeout)
+        if not line:
+            raise ConnectionError("Connection closed by RobotGrid server")
+        return line.decode().strip()
+
+    async def _send(self, payload):
+        """Write a batch; same policy as GridConnection, only a failed write to a reused connection is retried"""
+        if self.writer is not None and (self.reader.at_eof() or self.writer.is_closing()):
+            await self.close()
+        reused = self.writer is not None
+        await self.connect()
+        try:
+            self.writer.write(payload)
+            await asyncio.wait_for(self.writer.drain(), self.timeout)
+        except asyncio.TimeoutError:
+            await self.close()
+            raise
+        except OSError:
+            await self.close()
+            if not reused:
+                raise
+            await self.connect()
+            try:
+                self.writer.write(payload)
+                await asyncio.wait_for(self.writer.drain(), self.timeout)
+            except (asyncio.TimeoutError, OSError):
+                await self.close()
+                raise
+
+    async def pipeline(self, commands):
+        """Send every command in one write and return the replies in order"""
+        commands = [command.strip() for command in commands if command.strip()]
+        if not commands:
+            return []
+        await self._send("".join(f"{command}\n" for command in commands).encode())
+        try:
+            return [await self._readline() for _ in commands]
+        except (asyncio.TimeoutError, OSError):
+            # Some commands may have run; never resend them
+            await self.close()
+            raise
+
+
+class GridConnectionPool:
+    """Up to `size` AsyncGridConnections shared by many concurrent tasks.
+
+    Each task borrows a connection for one pipelined batch, so replies never
+    interleave; connections are opened lazily and dropped after errors.
+    """
+
+    def __init__(self, host, port, size=8, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.idle = []
+        self.slots = asyncio.Semaphore(size)
+
+    @asynccontextmanager
+    async def connection(self):
+        async with self.slots:
+            connection = self.idle.pop() if self.idle else AsyncGridConnection(self.host, self.port, self.timeout)
+            try:
+                yield connection
+            except BaseException:
+                await connection.close()
+                raise
+            self.idle.append(connection)
+
+    async def pipeline(self, commands):
+        async with self.connection() as connection:
+            return await connection.pipeline(commands)
+
+    async def close(self):
+        idle, self.idle = self.idle, []
+        for connection in idle:
+            await connection.close()
@@ -0,0 +1,204 @@
+import re
+
+# Instructions simple enough to translate without the LLM. Every clause of an
+# instruction has to match one of the rules below exactly; anything else makes
+# parse_intent return None so the instruction goes to the LLM as before.
+
+HEADINGS = {"up": 0, "north": 0, "right": 90, "east": 90, "down": 180, "south": 180, "left": 270, "west": 270}
+NUMBER_WORDS = {
+    "zero": 0, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6, "seven": 7, "eight": 8,
+    "nine": 9, "ten": 10, "eleven": 11, "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15,
+    "sixteen": 16, "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20,
+}
+MAX_REPEAT = 10
+
+UNIT = r"(?:\s+(?:steps?|spaces?|squares?|cells?|units?|blocks?|tiles?))?"
+MOVE_VERB = r"(?:(?:move|go|drive|walk|step|head|roll|travel|run)\s+)?"
+GO_TO = r"(?:go|move|drive|walk|head|travel|navigate|return|get|come)\s+(?:back\s+)?to\s+"
+
+TURN = re.compile(r"^(?:turn|rotate|spin|pivot)\s+(?:to\s+)?(left|right)$")
+# "Face" names an absolute heading, not a turn
+FACE = re.compile(r"^(?:face|point|turn\s+to\s+face)\s+(?:to\s+)?(up|down|left|right|north|south|east|west)(?:wards?)?$")
+TURN_DEGREES = re.compile(r"^(?:turn|rotate|spin)\s+(?:(left|right)\s+(90|180|270)|(90|180|270)\s+(?:degrees?\s+)?"
+                          r"(?:to\s+)?(left|right))(?:\s+degrees?)?$")
+TURN_AROUND = re.compile(r"^(?:turn|spin)\s+around$|^u\s*turn$|^about\s+face$")
+MOVE = re.compile(rf"^{MOVE_VERB}(forwards?|ahead|straight|backwards?)(?:\s+(\d+))?{UNIT}$")
+MOVE_BACK = re.compile(rf"^(?:{MOVE_VERB}back|back\s+up)(?:\s+(\d+))?{UNIT}$")
+MOVE_COUNT_FIRST = re.compile(rf"^{MOVE_VERB}(\d+){UNIT}(?:\s+(forwards?|ahead|straight|backwards?|back))?$")
+CENTER = re.compile(rf"^(?:(?:{GO_TO})?(?:center|centre|middle)|(?:re)?cent(?:er|re)|"
+                    rf"(?:put|place|bring|move)\s+(?:it\s+)?(?:back\s+)?(?:in|into|to|at)\s+(?:center|centre|middle))$")
+POSITION = re.compile(r"^(?:where\s+(?:is\s+it|are\s+you|is|am\s+i)|(?:what\s+is|whats|get|show|report|tell\s+me)?\s*"
+                      r"(?:your\s+|current\s+)?(?:position|location))$")
+GOTO = re.compile(rf"^(?:goto|{GO_TO}(?:cell\s+|square\s+|position\s+|coordinates?\s+|point\s+)?)(\d+)\s+(\d+)$")
+EDGE = re.compile(rf"^{GO_TO}(top|bottom|upper|lower|left|right)\s+(?:edge|wall|side|border)$")
+CORNER = re.compile(rf"^{GO_TO}(?:(top|bottom|upper|lower)\s+(left|right)|(left|right)\s+(top|bottom|upper|lower))"
+                    r"\s+corner$")
+SHAPE_WORDS = {
+    "move", "drive", "go", "walk", "in", "a", "an", "square", "rectangle", "pattern", "shape", "with", "where",
+    "whose", "that", "has", "of", "side", "sides", "length", "lengths", "size", "is", "are", "each", "by", "x",
+    "steps", "spaces", "squares", "cells", "long", "wide", "clockwise", "counterclockwise", "anticlockwise",
+    "to", "left", "right", "turning",
+}
+
+CLAUSE_SEPARATOR = re.compile(r"\s*(?:,|;|\band\s+then\b|\bthen\b|\band\b|\bafter\s+that\b|\bfollowed\s+by\b)\s*")
+LEADING_FILLER = re.compile(r"^(?:then|also|now|just|can\s+you|could\s+you|would\s+you|will\s+you|"
+                            r"i\s+want\s+you\s+to|id\s+like\s+you\s+to|lets|finally|first|next)\s+")
+TRAILING_FILLER = re.compile(r"\s+(?:right\s+now|now|for\s+me|again|(?:of|on|in)\s+(?:grid|board|map))$")
+REPEAT = re.compile(r"^(.*?)\s+(?:(\d+)\s+times|(twice)|(thrice))$")
+
+
+def normalize(instruction):
+    text = instruction.lower().replace("-", " ").replace("'", "")
+    # Coordinates like "to (3, 4)" lose their comma before clauses are split on commas
+    text = re.sub(r"\b(to|at)\s*\(?\s*(\d+)\s*,\s*(\d+)\s*\)?", r"\1 \2 \3", text)
+    text = re.sub(r"[^a-z0-9,;\s]", " ", text)
+    words = [str(NUMBER_WORDS.get(word, word)) for word in text.split() if word not in ("the", "robot", "please")]
+    text = " ".join(words)
+    return re.sub(r"\ban?\s+(step|space|cell|block|tile)\b", r"1 \1", text)
+
+
+def parse_intent(instruction, width=None, height=None, pose=None):
+    """Translate a simple instruction into validated commands, or None if it isn't simple.
+
+    Edges and corners need the grid size and the robot's pose, and facing a
+    direction needs the robot's direction; without them those instructions
+    are left to the LLM too. The pose is followed through the clauses as far
+    as it is known: turns change the direction, while after a move the
+    position is up to the grid.
+    """
+    commands = []
+    pose = pose or (None, None, None)
+    for clause in CLAUSE_SEPARATOR.split(normalize(instruction)):
+        clause = clause.strip()
+        while LEADING_FILLER.match(clause):
+            clause = LEADING_FILLER.sub("", clause, count=1)
+        clause = TRAILING_FILLER.sub("", clause)
+        if not clause:
+            continue
+        repeat = 1
+        match = REPEAT.match(clause)
+        if match:
+            clause = match.group(1)
+            repeat = int(match.group(2)) if match.group(2) else 2 if match.group(3) else 3
+            if not 1 <= repeat <= MAX_REPEAT:
+                return None
+        parsed = parse_clause(clause, width, height, pose)
+        if parsed is None:
+            return None
+        commands += parsed * repeat
+        for command in parsed * repeat:
+            pose = advance(pose, command)
+    return commands or None
+
+
+def advance(pose, command):
+    """What is still known of the pose after a command"""
+    x, y, direction = pose
+    if command in ("turn left", "turn right"):
+        if direction is not None:
+            direction = (direction + (90 if command == "turn right" else -90)) % 360
+        return x, y, direction
+    if command == "position":
+        return pose
+    # Moves may be stopped by obstacles, and a goto's path decides the final direction
+    if command.startswith("goto"):
+        direction = None
+    return None, None, direction
+
+
+def parse_clause(clause, width, height, pose):
+    match = TURN.match(clause)
+    if match:
+        return [f"turn {match.group(1)}"]
+    match = TURN_DEGREES.match(clause)
+    if match:
+        direction = match.group(1) or match.group(4)
+        degrees = int(match.group(2) or match.group(3))
+        return [f"turn {direction}"] * (degrees // 90)
+    if TURN_AROUND.match(clause):
+        return ["turn right", "turn right"]
+    match = FACE.match(clause)
+    if match:
+        if pose[2] is None:
+            return None
+        turns = (HEADINGS[match.group(1)] - pose[2]) % 360 // 90
+        # Already facing that way is answered with the position rather than nothing
+        return {0: ["position"], 1: ["turn right"], 2: ["turn right", "turn right"], 3: ["turn left"]}[turns]
+    match = MOVE.match(clause)
+    if match:
+        word = "backward" if match.group(1).startswith("backward") else "forward"
+        return [f"{word} {int(match.group(2) or 1)}"]
+    match = MOVE_BACK.match(clause)
+    if match and match.group(1):
+        # "go back" alone could mean returning somewhere, so only a distance makes it a move
+        return [f"backward {int(match.group(1))}"]
+    match = MOVE_COUNT_FIRST.match(clause)
+    if match:
+        word = "backward" if match.group(2) and match.group(2).startswith("back") else "forward"
+        return [f"{word} {int(match.group(1))}"]
+    if CENTER.match(clause):
+        return ["center"]
+    if POSITION.match(clause):
+        return ["position"]
+    match = GOTO.match(clause)
+    if match:
+        x, y = int(match.group(1)), int(match.group(2))
+        if width is not None and (x >= width or y >= height):
+            return None
+        return [f"goto {x} {y}"]
+    if width is None or pose[0] is None:
+        return None
+    match = EDGE.match(clause)
+    if match:
+        x, y = pose[0], pose[1]
+        side = match.group(1)
+        if side in ("top", "upper"):
+            y = 0
+        elif side in ("bottom", "lower"):
+            y = height - 1
+        elif side == "left":
+            x = 0
+        else:
+            x = width - 1
+        return [f"goto {x} {y}"]
+    match = CORNER.match(clause)
+    if match:
+        vertical = match.group(1) or match.group(4)
+        horizontal = match.group(2) or match.group(3)
+        x = 0 if horizontal == "left" else width - 1
+        y = 0 if vertical in ("top", "upper") else height - 1
+        return [f"goto {x} {y}"]
+    return parse_shape(clause)
+
+
+def parse_shape(clause):
+    """Squares and rectangles, e.g. "move in a square pattern where sides are 4" """
+    words = clause.split()
+    shape = "square" if "square" in words else "rectangle" if "rectangle" in words else None
+    if shape is None:
+        return None
+    numbers = [int(word) for word in words if word.isdigit()]
+    if any(not word.isdigit() and word not in SHAPE_WORDS for word in words):
+        return None
+    if shape == "square" and len(numbers) == 1:
+        sides = numbers * 4
+    elif shape == "rectangle" and len(numbers) == 2:
+        sides = numbers * 2
+    else:
+        return None
+    if not all(sides):
+        return None
+    turn = "turn left" if {"counterclockwise", "anticlockwise", "left"} & set(words) else "turn right"
+    commands = []
+    for side in sides:
+        commands += [f"forward {side}", turn]
+    return commands
+
+
+def needs_pose(instruction, width=None, height=None, pose=None):
+    """True if the instruction only fails to parse because part of the pose is unknown"""
+    pose = pose or (None, None, None)
+    if None not in pose:
+        return False
+    placeholder = tuple(0 if value is None else value for value in pose)
+    return parse_intent(instruction, width, height, placeholder) is not None
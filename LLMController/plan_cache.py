@@ -0,0 +1,108 @@
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+
+# Instructions that mention absolute places or directions on the grid produce
+# plans that depend on where the robot is and which way it faces; everything
+# else is relative to the robot. "Turn left" is relative, "the left side",
+# "to the left" and "face left" are not.
+POSE_DEPENDENT = re.compile(
+    r"\b(center|centre|middle|edge|corner|wall|border|side of the grid|origin|"
+    r"position|where|back to|return|row|column|\d+\s*,\s*\d+|face|facing|point|"
+    r"up|down|upwards?|downwards?|north|south|east|west|(north|south)(east|west)|"
+    r"top|bottom|upper|lower|above|below|(left|right)(\s+hand)?\s+(side|half)|to the (left|right))\b")
+
+
+def normalize_instruction(instruction):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variations share a key"""
+    instruction = instruction.lower().replace("please", " ")
+    instruction = re.sub(r"[^a-z0-9,\s]", " ", instruction)
+    return " ".join(instruction.replace(",", " , ").split())
+
+
+class PlanCache:
+    """LRU cache of LLM plans with a time-to-live and an optional JSON file behind it.
+
+    Plans are keyed on the normalized instruction; the robot's pose is only
+    part of the key when the instruction refers to an absolute location or
+    direction, so relative instructions like "move in a square pattern" hit
+    from anywhere.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.entries = OrderedDict()  # key -> (expires_at, plan)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def depends_on_pose(self, instruction):
+        return bool(POSE_DEPENDENT.search(normalize_instruction(instruction)))
+
+    def key(self, instruction, pose=None):
+        """The cache key, or None if the instruction depends on a pose that isn't known"""
+        normalized = normalize_instruction(instruction)
+        if self.depends_on_pose(instruction):
+            return f"{normalized} @ {pose}" if pose is not None else None
+        return normalized
+
+    def get(self, instruction, pose=None):
+        """Return the cached plan, or None on a miss"""
+        key = self.key(instruction, pose)
+        entry = self.entries.get(key) if key is not None else None
+        if entry is not None and entry[0] < time.time():
+            del self.entries[key]
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, instruction, pose, plan):
+        key = self.key(instruction, pose)
+        if key is None:
+            return
+        self.entries[key] = (time.time() + self.ttl, plan)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        if self.path:
+            self.save()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def load(self):
+        try:
+            with open(self.path, "r") as file:
+                stored = json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Could not load plan cache from {self.path}: {e}")
+            return
+        now = time.time()
+        for key, expires_at, plan in stored[-self.max_entries:]:
+            if expires_at >= now:
+                self.entries[key] = (expires_at, plan)
+
+    def save(self):
+        # Write to a temporary file first so a crash never leaves a truncated cache
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as file:
+            json.dump([[key, expires_at, plan] for key, (expires_at, plan) in self.entries.items()], file)
+        os.replace(temp_path, self.path)
@@ -0,0 +1,150 @@
+"""Peephole optimizer for validated robot plans.
+
+Plans are parsed into a small IR of [kind, value] ops:
+
+- ["move", n]      signed distance, forward positive and backward negative
+- ["turn", n]      signed quarter turns, right positive and left negative
+- ["center", None] jump to the middle of the grid
+- ["position", None] position query; nothing is moved across it
+- ["goto", (x, y)] absolute target; the grid plans the path around its obstacles
+
+Each line sent to the grid costs a round trip and each step or turn costs an
+animation tick, so the compiler emits the shortest equivalent plan.
+"""
+
+MOVE, TURN, CENTER, POSITION, GOTO = "move", "turn", "center", "position", "goto"
+
+
+def parse_command(command):
+    parts = command.lower().split()
+    if parts == ["turn", "left"]:
+        return [TURN, -1]
+    elif parts == ["turn", "right"]:
+        return [TURN, 1]
+    elif parts == ["center"]:
+        return [CENTER, None]
+    elif parts == ["position"]:
+        return [POSITION, None]
+    elif len(parts) == 2 and parts[0] in ("forward", "backward"):
+        return [MOVE, int(parts[1]) if parts[0] == "forward" else -int(parts[1])]
+    elif len(parts) == 3 and parts[0] == "goto":
+        return [GOTO, (int(parts[1]), int(parts[2]))]
+    raise ValueError(f"Cannot compile command: {command}")
+
+
+def emit(ops):
+    """Turn IR ops back into command lines"""
+    lines = []
+    for kind, value in ops:
+        if kind == MOVE and value:
+            lines.append(f"forward {value}" if value > 0 else f"backward {-value}")
+        elif kind == TURN:
+            lines += {1: ["turn right"], 2: ["turn right", "turn right"], 3: ["turn left"]}.get(value % 4, [])
+        elif kind in (CENTER, POSITION):
+            lines.append(kind)
+        elif kind == GOTO:
+            lines.append(f"goto {value[0]} {value[1]}")
+    return lines
+
+
+def plan_ticks(lines):
+    """Simulation ticks a plan takes: one per cell moved, turn or center; gotos depend on the map and aren't counted"""
+    ticks = 0
+    for kind, value in map(parse_command, lines):
+        if kind == MOVE:
+            ticks += abs(value)
+        elif kind in (TURN, CENTER):
+            ticks += 1
+    return ticks
+
+
+def shortest_offset(delta, length):
+    """The smallest signed distance equivalent to `delta` on a ring of `length` cells"""
+    delta %= length
+    return delta - length if delta > length // 2 else delta
+
+
+class PlanCompiler:
+    """Compiles validated plans into the shortest equivalent plan.
+
+    The grid size and starting direction come from the caller's tracked
+    state; when they are unknown, moves are not reduced modulo the grid.
+    On a grid with obstacles a move or center into a blocked cell leaves the
+    robot where it is, so where a plan ends depends on the map: only
+    neighbouring moves in the same direction and neighbouring turns are
+    combined, and nothing is reduced, cancelled or dropped. Gotos are sent
+    as they are, since only the grid knows the way around its
+    obstacles; nothing is moved across one, and the direction is unknown
+    after it. Totals of lines and ticks before and after compilation are
+    kept in `stats`.
+    """
+
+    def __init__(self):
+        self.stats = {"plans": 0, "lines_in": 0, "lines_out": 0, "ticks_in": 0, "ticks_out": 0}
+
+    def compile(self, commands, width=None, height=None, direction=None, obstacles=True):
+        ops = [parse_command(command) for command in commands]
+        while True:
+            optimized = self.optimize(ops, width, height, direction, obstacles)
+            if optimized == ops:
+                break
+            ops = optimized
+        lines = emit(ops)
+        self.record(commands, lines)
+        return lines
+
+    def record(self, commands, lines):
+        self.stats["plans"] += 1
+        self.stats["lines_in"] += len(commands)
+        self.stats["lines_out"] += len(lines)
+        self.stats["ticks_in"] += plan_ticks(commands)
+        self.stats["ticks_out"] += plan_ticks(lines)
+
+    def optimize(self, ops, width, height, direction, obstacles):
+        """One peephole pass over the IR"""
+        out = []
+        for kind, value in ops:
+            if kind == MOVE and width is not None and direction is not None and not obstacles:
+                # Wrapping all the way around the torus is a no-op
+                value = shortest_offset(value, width if direction in (90, 270) else height)
+            if kind in (MOVE, TURN) and value == 0:
+                continue
+            if kind == TURN:
+                value %= 4
+                if value == 0:
+                    continue
+            if out and out[-1][0] == kind and kind in (MOVE, TURN, CENTER) and not (
+                    obstacles and kind == MOVE and (out[-1][1] > 0) != (value > 0)):
+                # Coalesce neighbours: moves and turns add up, repeated centers are redundant
+                if kind != CENTER:
+                    out[-1][1] += value
+                    if kind == TURN:
+                        out[-1][1] %= 4
+                    if out[-1][1] == 0:
+                        out.pop()
+            elif kind == CENTER and not obstacles:
+                # Moves since the last center or position query don't change where a center ends up
+                kept = []
+                while out and out[-1][0] in (MOVE, TURN):
+                    op = out.pop()
+                    if op[0] == TURN:
+                        kept.append(op)
+                out += reversed(kept)
+                out.append([CENTER, None])
+            else:
+                out.append([kind, value])
+            if kind == TURN and direction is not None:
+                direction = (direction + value * 90) % 360
+            elif kind == GOTO:
+                direction = None
+        return out
+
+
+def plan_direction(direction, lines):
+    """The direction after running command lines from `direction`, or None once a goto has run"""
+    for kind, value in map(parse_command, lines):
+        if direction is None or kind == GOTO:
+            return None
+        if kind == TURN:
+            direction = (direction + value * 90) % 360
+    return direction
@@ -0,0 +1,101 @@
+DIRECTION_NAMES = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}
+
+
+def command_steps(command):
+    """Steps a command adds to the robot's queue on the grid; a goto counts one until it is planned"""
+    parts = command.lower().split()
+    if len(parts) == 2 and parts[0] in ("forward", "backward"):
+        return int(parts[1])
+    return 0 if parts == ["position"] else 1
+
+
+class PoseTracker:
+    """The robot's pose as last reported by the grid, for planning the next instruction.
+
+    The grid acknowledges commands as soon as they are queued and may leave
+    the robot short of where a move would take it when a cell is blocked, so
+    the position is unknown after a move, center or goto until the grid
+    reports it again. The direction is followed locally through turns and
+    moves, which never change it; only a goto, whose path the grid plans,
+    makes it unknown. States pushed by the server (see `observe`) provide the
+    pose once the robot is idle and has run every command acknowledged so
+    far, which is the pose the next plan starts from. `invalidate` forces a
+    fresh sync, e.g. after a connection error.
+    """
+
+    def __init__(self):
+        self.width = None
+        self.height = None
+        self.obstacles = True
+        self.position = None  # (x, y)
+        self.direction = None
+        # Steps the robot must have counted (queued + completed) before a pushed
+        # state includes every command acknowledged here; None until the first push
+        self.expected = None
+
+    @property
+    def pose(self):
+        """(x, y, direction), or None unless both are known"""
+        if self.position is None or self.direction is None:
+            return None
+        return (*self.position, self.direction)
+
+    @property
+    def partial_pose(self):
+        """(x, y, direction) with None for whatever is unknown"""
+        x, y = self.position or (None, None)
+        return x, y, self.direction
+
+    def invalidate(self):
+        self.position = None
+        self.direction = None
+
+    def set_dimensions(self, reply):
+        fields = reply.split()
+        self.width, self.height = int(fields[0]), int(fields[1])
+        # Grids that don't say whether they have obstacles are assumed to have some
+        self.obstacles = len(fields) < 3 or fields[2] != "0"
+
+    def set_position(self, reply):
+        x, y, direction = reply.split()[:3]
+        self.position = (int(x), int(y))
+        self.direction = int(direction)
+
+    def observe(self, x, y, direction, queued, completed):
+        """Take the pose from a pushed state if it is final; returns True if it was taken.
+
+        A state is final when nothing is queued and the robot's step count
+        covers every command acknowledged so far: an idle state pushed before
+        the grid picked up the latest commands is stale.
+        """
+        total = queued + completed
+        if self.expected is None:
+            # The first state is pushed on subscribing, before any command is sent
+            self.expected = total
+        if queued or total < self.expected:
+            return False
+        self.expected = total
+        self.position = (x, y)
+        self.direction = direction
+        return True
+
+    def apply(self, command):
+        """Account for an acknowledged command; the position of anything that moves is left to the grid"""
+        if self.expected is not None:
+            self.expected += command_steps(command)
+        parts = command.lower().split()
+        if parts == ["turn", "left"] and self.direction is not None:
+            self.direction = (self.direction - 90) % 360
+        elif parts == ["turn", "right"] and self.direction is not None:
+            self.direction = (self.direction + 90) % 360
+        elif parts[:1] == ["goto"]:
+            self.invalidate()
+        elif parts not in (["position"], ["turn", "left"], ["turn", "right"]):
+            self.position = None
+
+    def describe(self):
+        direction = DIRECTION_NAMES.get(self.direction, str(self.direction)) if self.direction is not None else "unknown"
+        if self.position is None:
+            return f"Position: unknown until the robot stops, Facing: {direction}"
+        x, y = self.position
+        return f"Position: ({x}, {y}), Facing: {direction}"
@@ -0,0 +1,224 @@
+"""Controller service: many concurrent operator sessions in one asyncio process.
+
+Each TCP connection to the service is a session. Sessions send one natural
+language instruction per line and get one JSON line back with the compiled
+plan, the grid's replies and the time taken. Sessions are assigned robots
+round-robin; when there are more sessions than robots, sessions sharing a
+robot take turns, one instruction at a time, so their plans never interleave.
+Robots' poses come from states the grid pushes on one subscription
+connection, so each plan starts from where the last one left the robot.
+"""
+
+import asyncio
+import json
+import os
+import time
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from chat import API_KEY, MODEL, PLAN_CACHE_PATH, PLAN_CACHE_SIZE, PLAN_CACHE_TTL, POSE_WAIT, TCP_HOST, TCP_PORT
+from chat import to_server_command, validate_command
+from grid_client import AsyncGridSubscription, GridConnectionPool
+from intent_parser import needs_pose, parse_intent
+from plan_cache import PlanCache
+from plan_compiler import PlanCompiler
+from pose_tracker import PoseTracker
+
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("SERVICE_PORT", "12346"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))  # LLM calls in flight at once
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "50"))  # LLM calls started per second
+GRID_POOL_SIZE = int(os.getenv("GRID_POOL_SIZE", "8"))  # Connections to the RobotGrid
+
+
+class RateLimiter:
+    """Bounds concurrent calls and the rate at which they start (a token bucket)"""
+
+    def __init__(self, max_concurrency, rate, burst=None):
+        self.slots = asyncio.Semaphore(max_concurrency)
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire_token(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    async def __aenter__(self):
+        await self.slots.acquire()
+        try:
+            await self.acquire_token()
+        except BaseException:
+            self.slots.release()
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.slots.release()
+
+
+def make_llm_client(max_llm_calls=LLM_MAX_CONCURRENCY, **kwargs):
+    """An AsyncOpenAI client whose connection pool fits `max_llm_calls` requests in flight"""
+    limits = httpx.Limits(max_connections=max_llm_calls, max_keepalive_connections=max_llm_calls)
+    return AsyncOpenAI(http_client=DefaultAsyncHttpxClient(limits=limits), **kwargs)
+
+
+class ControllerService:
+    def __init__(self, grid_host=TCP_HOST, grid_port=TCP_PORT, llm_client=None, plan_cache=None,
+                 max_llm_calls=LLM_MAX_CONCURRENCY, llm_rate=LLM_RATE_LIMIT, pool_size=GRID_POOL_SIZE):
+        self.pool = GridConnectionPool(grid_host, grid_port, pool_size)
+        self.llm_client = llm_client or make_llm_client(max_llm_calls, api_key=API_KEY)
+        self.limiter = RateLimiter(max_llm_calls, llm_rate)
+        self.plan_cache = plan_cache or PlanCache(PLAN_CACHE_SIZE, PLAN_CACHE_TTL, PLAN_CACHE_PATH)
+        self.compiler = PlanCompiler()
+        self.subscription = AsyncGridSubscription(grid_host, grid_port, self.on_event)
+        self.robots = 1
+        self.dimensions = None
+        self.trackers = {}
+        self.synced = {}  # robot -> Event set while its tracker knows the pose
+        self.locks = {}
+        self.sessions = 0
+        self.server = None
+
+        with open("system_prompt.md", "r") as file:
+            self.system_prompt = file.read()
+
+    async def start(self, host=SERVICE_HOST, port=SERVICE_PORT):
+        robots, self.dimensions = await self.pool.pipeline(["GET_ROBOTS", "GET_DIMENSIONS"])
+        self.robots = int(robots)
+        self.server = await asyncio.start_server(self.handle_session, host, port, backlog=1024)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        await self.subscription.close()
+        await self.pool.close()
+
+    async def handle_session(self, reader, writer):
+        robot = self.sessions % self.robots
+        self.sessions += 1
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                instruction = line.decode(errors="replace").strip()
+                if not instruction:
+                    continue
+                result = await self.handle_instruction(robot, instruction)
+                writer.write((json.dumps(result) + "\n").encode())
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def handle_instruction(self, robot, instruction):
+        start = time.perf_counter()
+        # Sessions sharing a robot are served one instruction at a time
+        async with self.locks.setdefault(robot, asyncio.Lock()):
+            try:
+                commands, replies = await self.run_instruction(robot, instruction)
+                result = {"robot": robot, "commands": commands, "replies": replies}
+            except Exception as e:
+                self.trackers.pop(robot, None)
+                result = {"robot": robot, "error": str(e)}
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def run_instruction(self, robot, instruction):
+        tracker = await self.get_tracker(robot)
+        if tracker.pose is None and (self.plan_cache.depends_on_pose(instruction) or
+                                     needs_pose(instruction, tracker.width, tracker.height, tracker.partial_pose)):
+            # Only plans about absolute places and headings wait for the robot to stop
+            await self.sync_pose(robot, tracker)
+        position = tracker.describe() if tracker.pose is not None else None
+        local = parse_intent(instruction, tracker.width, tracker.height, tracker.partial_pose)
+        plan = "\n".join(local) if local else self.plan_cache.get(instruction, position)
+        if plan is None:
+            plan = await self.call_llm(instruction, tracker.describe())
+            if plan:
+                self.plan_cache.put(instruction, position, plan)
+        commands = self.compiler.compile(plan.split("\n") if plan else [], tracker.width, tracker.height,
+                                         tracker.direction, tracker.obstacles)
+        # Accounted for before sending, so states pushed while the replies are on their way are judged against them
+        for command in commands:
+            tracker.apply(command)
+        if tracker.pose is None:
+            self.synced[robot].clear()
+        prefix = f"R{robot} " if robot else ""
+        replies = await self.pool.pipeline([prefix + to_server_command(command) for command in commands])
+        if any(reply != "OK" for command, reply in zip(commands, replies) if command != "position"):
+            self.trackers.pop(robot, None)
+        return commands, replies
+
+    async def get_tracker(self, robot):
+        """The robot's tracker, subscribed to its states"""
+        tracker = self.trackers.get(robot)
+        if tracker is None:
+            tracker = PoseTracker()
+            tracker.set_dimensions(self.dimensions)
+            self.trackers[robot] = tracker
+            self.synced[robot] = asyncio.Event()
+            try:
+                await self.subscription.subscribe(robot)
+            except (asyncio.TimeoutError, OSError) as e:
+                print(f"Could not subscribe to R{robot}: {e}")
+        return tracker
+
+    async def sync_pose(self, robot, tracker):
+        """Wait until the tracker knows where the robot's queue ends"""
+        try:
+            await asyncio.wait_for(self.synced[robot].wait(), POSE_WAIT)
+        except asyncio.TimeoutError:
+            # Where the robot is now, possibly partway through its queue
+            prefix = f"R{robot} " if robot else ""
+            tracker.set_position((await self.pool.pipeline([prefix + "GET_POSITION"]))[0])
+
+    def on_event(self, robot, x, y, direction, queued, completed):
+        tracker = self.trackers.get(robot)
+        if tracker is not None and tracker.observe(x, y, direction, queued, completed):
+            self.synced[robot].set()
+
+    async def call_llm(self, instruction, position):
+        messages = [
+            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": f"The robot is currently at this position: {position}"},
+            {"role": "user", "content": instruction}
+        ]
+        async with self.limiter:
+            response = await self.llm_client.chat.completions.create(
+                model=MODEL, messages=messages, response_format={"type": "json_object"})
+        commands = json.loads(response.choices[0].message.content.strip())["commands"]
+        return "\n".join(command for command in map(validate_command, commands) if command)
+
+
+async def serve():
+    service = ControllerService()
+    port = await service.start()
+    print(f"Controller service listening on {SERVICE_HOST}:{port} "
+          f"({service.robots} robot{'s' if service.robots != 1 else ''}, "
+          f"{LLM_MAX_CONCURRENCY} concurrent LLM calls, {LLM_RATE_LIMIT:g}/s)")
+    try:
+        await service.server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,59 @@
+import json
+import re
+
+COMMANDS_KEY = re.compile(r'"commands"\s*:\s*\[')
+
+
+class CommandStreamParser:
+    """Incrementally extract the strings of the "commands" array from streamed JSON.
+
+    Feed it the completion text as it arrives; each call returns the command
+    strings that were completed by that chunk, so they can be dispatched
+    before the rest of the response has been generated.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.position = None  # Index just past the opening "[" once the array has been found
+        self.done = False
+
+    def feed(self, text):
+        if self.done:
+            return []
+        self.buffer += text
+        if self.position is None:
+            match = COMMANDS_KEY.search(self.buffer)
+            if match is None:
+                return []
+            self.position = match.end()
+
+        commands = []
+        while self.position < len(self.buffer):
+            char = self.buffer[self.position]
+            if char in " \t\r\n,":
+                self.position += 1
+            elif char == "]":
+                self.done = True
+                break
+            elif char == '"':
+                end = self.find_string_end(self.position + 1)
+                if end is None:
+                    break  # The string is still being generated
+                commands.append(json.loads(self.buffer[self.position:end + 1]))
+                self.position = end + 1
+            else:
+                # Not a string element; skip it rather than stall the stream
+                self.position += 1
+        return commands
+
+    def find_string_end(self, start):
+        escaped = False
+        for index in range(start, len(self.buffer)):
+            char = self.buffer[index]
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                return index
+        return None
@@ -0,0 +1,53 @@
+import time
+from contextlib import contextmanager
+
+PHASES = ("pose", "llm", "dispatch")
+
+
+class LatencyRecorder:
+    """Per-request latency broken down into pose fetch, LLM call and dispatch"""
+
+    def __init__(self):
+        self.history = []
+        self.current = None
+        self.started = None
+
+    def start(self):
+        self.current = dict.fromkeys(PHASES, 0.0)
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            if self.current is not None:
+                self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - start
+
+    def mark(self, name):
+        """Record the time since the request started, e.g. when the first command was sent"""
+        if self.current is not None and name not in self.current:
+            self.current[name] = time.perf_counter() - self.started
+
+    def finish(self):
+        timings = self.current
+        timings["total"] = time.perf_counter() - self.started
+        self.history.append(timings)
+        self.current = None
+        return timings
+
+    @staticmethod
+    def format(timings):
+        return " | ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+
+    def summary(self):
+        """Mean and worst case of every phase over all finished requests"""
+        if not self.history:
+            return "no requests"
+        names = list(dict.fromkeys(name for timings in self.history for name in timings))
+        parts = []
+        for name in names:
+            values = [timings[name] for timings in self.history if name in timings]
+            parts.append(f"{name} mean {sum(values) / len(values) * 1000:.1f} ms / max {max(values) * 1000:.1f} ms")
+        return f"{len(self.history)} requests: " + ", ".join(parts)
@@ -0,0 +1,84 @@
+import json
+import time
+from types import SimpleNamespace
+
+# Trace files are JSON Lines, one record per instruction, appended as each
+# instruction finishes:
+#   time         wall clock time the instruction was entered (seconds since the epoch)
+#   instruction  the text the operator typed
+#   pose         tracked [x, y, direction] before the instruction, or null if unknown
+#   source       where the plan came from: "local", "cache" or "llm"
+#   llm          the raw LLM response, or null if no LLM call was made
+#   commands     commands dispatched to the grid, in order
+#   replies      the grid's replies to them
+#   timings      milliseconds spent in each phase, plus the total
+
+
+class TraceRecorder:
+    """Appends one compact JSON line per instruction to a trace file"""
+
+    def __init__(self, path):
+        self.path = path
+        # Line buffered, so a crashed session still leaves every finished record behind
+        self.file = open(path, "a", buffering=1)
+
+    def write(self, record):
+        self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+def load_trace(path):
+    """Read the records of a trace file, skipping a truncated last line"""
+    records = []
+    with open(path) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+class ReplayLLM:
+    """Stands in for the OpenAI client and answers with a recorded response.
+
+    Set `response` before each instruction. Streaming requests get the
+    response back in small chunks, as a real stream would deliver it.
+    """
+
+    CHUNK_SIZE = 16
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.response = None
+        self.calls = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, stream=False, **kwargs):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        content = self.response
+        if stream:
+            return (SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content[i:i + self.CHUNK_SIZE]))])
+                    for i in range(0, len(content), self.CHUNK_SIZE))
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def replay(records, controller, llm):
+    """Run recorded instructions through `controller`, whose LLM client is `llm`.
+
+    Returns the new record for every instruction, with a `diverged` flag set
+    when the dispatched commands differ from the recorded ones.
+    """
+    results = []
+    for record in records:
+        # Instructions that were answered from a persisted cache have no LLM
+        # response; if the replay has to ask, answer with what was dispatched
+        llm.response = record.get("llm") or json.dumps({"commands": record.get("commands") or []})
+        result = controller.handle_instruction(record["instruction"])
+        result["diverged"] = record.get("commands") is not None and result["commands"] != record["commands"]
+        results.append(result)
+    return results
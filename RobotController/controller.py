@@ -1,6 +1,102 @@
 import sys
-from PyQt5.QtWidgets import QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, QWidget, QMessageBox
-from PyQt5.QtNetwork import QTcpSocket
+import time
+from collections import deque
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtWidgets import QApplication, QMainWindow, QTextEdit, QPushButton, QVBoxLayout, QWidget, QMessageBox, QLabel
+from PyQt5.QtNetwork import QAbstractSocket, QTcpSocket
+
+HOST = "127.0.0.1"
+PORT = 12345
+RECONNECT_MS = 1000
+
+DIRECTION_NAMES = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}
+
+
+class GridClient(QObject):
+    """One persistent connection to the grid, driven entirely by socket signals.
+
+    Commands are queued and written as soon as the socket is connected; the
+    server answers every line in order, so replies are matched to commands
+    first in, first out and emitted with their round-trip time. Pushed EVENT
+    lines are emitted separately. The connection is re-established
+    automatically; commands that were in flight when it dropped are reported
+    as failed rather than resent, since they may already have been executed.
+    """
+
+    connected = pyqtSignal()
+    disconnected = pyqtSignal()
+    reply_received = pyqtSignal(str, str, float)  # command, reply, round trip in ms
+    command_failed = pyqtSignal(str)
+    event_received = pyqtSignal(str)
+
+    def __init__(self, host=HOST, port=PORT, parent=None):
+        super().__init__(parent)
+        self.host = host
+        self.port = port
+        self.outgoing = deque()  # Commands not yet written
+        self.in_flight = deque()  # (command, callback, sent_at) awaiting a reply
+        self.socket = QTcpSocket(self)
+        self.socket.connected.connect(self.on_connected)
+        self.socket.disconnected.connect(self.on_disconnected)
+        self.socket.errorOccurred.connect(self.on_error)
+        self.socket.readyRead.connect(self.on_ready_read)
+        self.reconnect_timer = QTimer(self)
+        self.reconnect_timer.setSingleShot(True)
+        self.reconnect_timer.timeout.connect(self.connect_to_host)
+
+    def connect_to_host(self):
+        if self.socket.state() == QAbstractSocket.UnconnectedState:
+            self.socket.connectToHost(self.host, self.port)
+
+    def is_connected(self):
+        return self.socket.state() == QAbstractSocket.ConnectedState
+
+    def send(self, command, callback=None):
+        """Queue a command; `callback(reply)` is called once its reply arrives"""
+        self.outgoing.append((command, callback))
+        if self.is_connected():
+            self.flush()
+        else:
+            self.connect_to_host()
+
+    def flush(self):
+        data = []
+        while self.outgoing:
+            command, callback = self.outgoing.popleft()
+            self.in_flight.append((command, callback, time.perf_counter()))
+            data.append(f"{command}\n")
+        if data:
+            self.socket.write("".join(data).encode())
+
+    def on_connected(self):
+        self.connected.emit()
+        self.flush()
+
+    def on_ready_read(self):
+        while self.socket.canReadLine():
+            line = self.socket.readLine().data().decode(errors="replace").strip()
+            if line.startswith("EVENT "):
+                self.event_received.emit(line)
+            elif self.in_flight:
+                command, callback, sent_at = self.in_flight.popleft()
+                self.reply_received.emit(command, line, (time.perf_counter() - sent_at) * 1000)
+                if callback is not None:
+                    # Run it from the event loop so a modal dialog can't re-enter this handler
+                    QTimer.singleShot(0, lambda callback=callback, line=line: callback(line))
+
+    def on_disconnected(self):
+        while self.in_flight:
+            self.command_failed.emit(self.in_flight.popleft()[0])
+        self.disconnected.emit()
+        if not self.reconnect_timer.isActive():
+            self.reconnect_timer.start(RECONNECT_MS)
+
+    def on_error(self, error):
+        # A refused or failed connection attempt never emits disconnected
+        if self.socket.state() == QAbstractSocket.UnconnectedState:
+            print(f"Connection error: {self.socket.errorString()}")
+            self.on_disconnected()
+
 
 class ClientWindow(QMainWindow):
     def __init__(self):
@@ -14,6 +110,10 @@ class ClientWindow(QMainWindow):
         layout = QVBoxLayout()
         central_widget.setLayout(layout)
 
+        # Live position pushed by the grid
+        self.position_label = QLabel("Position: unknown")
+        layout.addWidget(self.position_label)
+
         # Text edit for commands
         self.text_edit = QTextEdit()
         layout.addWidget(self.text_edit)
@@ -33,54 +133,66 @@ class ClientWindow(QMainWindow):
         self.get_position_button.clicked.connect(self.get_position)
         layout.addWidget(self.get_position_button)
 
+        # Round-trip latency readout
+        self.latency_label = QLabel("Latency: -")
+        self.statusBar().addPermanentWidget(self.latency_label)
+        self.round_trips = deque(maxlen=100)
+
+        self.client = GridClient(parent=self)
+        self.client.connected.connect(self.on_connected)
+        self.client.disconnected.connect(lambda: self.statusBar().showMessage("Disconnected, retrying..."))
+        self.client.reply_received.connect(self.on_reply)
+        self.client.command_failed.connect(lambda command: print(f"No reply for {command}: connection lost"))
+        self.client.event_received.connect(self.on_event)
+        self.statusBar().showMessage("Connecting...")
+        self.client.connect_to_host()
+
+    def on_connected(self):
+        self.statusBar().showMessage(f"Connected to {HOST}:{PORT}")
+        # Follow the robot instead of polling its position
+        self.client.send("SUBSCRIBE")
+
+    def on_reply(self, command, reply, round_trip):
+        self.round_trips.append(round_trip)
+        average = sum(self.round_trips) / len(self.round_trips)
+        self.latency_label.setText(f"Latency: {round_trip:.1f} ms (avg {average:.1f} ms)")
+
+    def on_event(self, event):
+        # EVENT <tick> R<id> <x> <y> <direction> <queued> <completed>
+        parts = event.split()
+        if len(parts) == 8:
+            x, y, direction, queued = parts[3], parts[4], int(parts[5]), parts[6]
+            self.position_label.setText(
+                f"Position: ({x}, {y}), Facing: {DIRECTION_NAMES.get(direction, direction)}, {queued} steps queued")
+
     def send_commands(self):
         commands = self.text_edit.toPlainText()
-        socket = QTcpSocket(self)
-        socket.connectToHost("127.0.0.1", 12345)
-        if socket.waitForConnected(1000):
-            socket.write(commands.encode())
-            socket.waitForBytesWritten()
-            socket.disconnectFromHost()
-        else:
-            print("Failed to connect to server")
+        for command in commands.splitlines():
+            if command.strip():
+                self.client.send(command.strip())
 
     def get_dimensions(self):
-        socket = QTcpSocket(self)
-        socket.connectToHost("127.0.0.1", 12345)
-        if socket.waitForConnected(1000):
-            socket.write("GET_DIMENSIONS\n".encode())
-            if socket.waitForReadyRead(1000):
-                response = socket.readLine().data().decode().strip()
-                QMessageBox.information(self, "Dimensions", f"Grid Dimensions: {response}")
-            else:
-                print("No response for GET_DIMENSIONS")
-            socket.disconnectFromHost()
-        else:
-            print("Failed to connect to server")
+        self.client.send("GET_DIMENSIONS", self.show_dimensions)
+
+    def show_dimensions(self, response):
+        # The width and height, without the obstacles flag
+        QMessageBox.information(self, "Dimensions", f"Grid Dimensions: {' '.join(response.split()[:2])}")
 
     def get_position(self):
-        socket = QTcpSocket(self)
-        socket.connectToHost("127.0.0.1", 12345)
-        if socket.waitForConnected(1000):
-            socket.write("GET_POSITION\n".encode())
-            if socket.waitForReadyRead(1000):
-                response = socket.readLine().data().decode().strip()
-                parts = response.split()
-                if len(parts) == 3:
-                    x, y, dir_deg = parts
-                    dir_text = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}.get(int(dir_deg), str(dir_deg))
-                    msg = f"Position: ({x}, {y}), Facing: {dir_text}"
-                    QMessageBox.information(self, "Position", msg)
-                else:
-                    print("Invalid response for GET_POSITION")
-            else:
-                print("No response for GET_POSITION")
-            socket.disconnectFromHost()
+        self.client.send("GET_POSITION", self.show_position)
+
+    def show_position(self, response):
+        parts = response.split()
+        if len(parts) == 3:
+            x, y, dir_deg = parts
+            dir_text = DIRECTION_NAMES.get(int(dir_deg), str(dir_deg))
+            msg = f"Position: ({x}, {y}), Facing: {dir_text}"
+            QMessageBox.information(self, "Position", msg)
         else:
-            print("Failed to connect to server")
+            print("Invalid response for GET_POSITION")
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = ClientWindow()
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
@@ -0,0 +1,550 @@
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+import wire
+from engine import BACKWARD, FORWARD, GOTO, TURN_LEFT, TURN_RIGHT, Simulation, SimulationRunner, execute_plan
+from occupancy import OccupancyMap
+from planner import PathPlanner
+import snapshot
+from server import GridServer
+from subscribers import run_subscribers
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def report(name, values, unit="ms", scale=1000):
+    print(f"{name}: mean {statistics.mean(values) * scale:.2f}{unit}  "
+          f"p50 {percentile(values, 50) * scale:.2f}{unit}  "
+          f"p99 {percentile(values, 99) * scale:.2f}{unit}  "
+          f"max {max(values) * scale:.2f}{unit}")
+
+
+async def simulated_client(port, commands, accept_latencies):
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    # The first reply proves the server accepted and is serving this client
+    writer.write(b"GET_POSITION\n")
+    await reader.readline()
+    accept_latencies.append(time.perf_counter() - start)
+
+    writer.write("".join(f"{command}\n" for command in commands).encode())
+    await writer.drain()
+    for _ in commands:
+        await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_clients(port, clients, commands):
+    accept_latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*(simulated_client(port, commands, accept_latencies) for _ in range(clients)))
+    return accept_latencies, time.perf_counter() - start
+
+
+def bench_load(args):
+    """Drive many concurrent clients against the threaded server"""
+    # Run the real simulation as fast as it can consume commands
+    simulation = Simulation()
+    runner = SimulationRunner(simulation, tick_interval=0)
+    server = GridServer("127.0.0.1", 0, simulation, on_command=runner.wake)
+    server.start()
+    runner.start()
+
+    commands = ["FORWARD 1", "TURN LEFT", "GET_POSITION", "BACKWARD 2"] * (args.commands // 4)
+    accept_latencies, elapsed = asyncio.run(run_clients(server.port, args.clients, commands))
+    server.stop()
+    runner.stop()
+
+    total = args.clients * (len(commands) + 1)
+    print(f"{args.clients} clients x {len(commands) + 1} commands in {elapsed:.3f}s")
+    report("accept latency", accept_latencies)
+    print(f"command throughput: {total / elapsed:,.0f} commands/s")
+    print(f"simulation steps executed: {simulation.ticks}")
+
+
+async def text_client(port, commands, batch):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    for start in range(0, len(commands), batch):
+        chunk = commands[start:start + batch]
+        writer.write("".join(f"{command}\n" for command in chunk).encode())
+        for _ in chunk:
+            await reader.readline()
+    writer.close()
+    await writer.wait_closed()
+
+
+async def binary_client(port, commands, batch):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    writer.write(f"PROTOCOL {wire.VERSION}\n".encode())
+    await reader.readline()
+    for request_id, start in enumerate(range(0, len(commands), batch)):
+        writer.write(wire.encode_batch(request_id, commands[start:start + batch]))
+        length = wire.HEADER.unpack(await reader.readexactly(wire.HEADER.size))[0]
+        wire.decode_results(await reader.readexactly(length))
+    writer.close()
+    await writer.wait_closed()
+
+
+async def run_protocol(client, port, clients, commands, batch):
+    start = time.perf_counter()
+    await asyncio.gather(*(client(port, commands, batch) for _ in range(clients)))
+    return time.perf_counter() - start
+
+
+def bench_wire(args):
+    """Throughput of the text protocol vs binary batch frames on the same server"""
+    simulation = Simulation()
+    runner = SimulationRunner(simulation, tick_interval=0)
+    server = GridServer("127.0.0.1", 0, simulation, on_command=runner.wake)
+    server.start()
+    runner.start()
+
+    text_commands = ["FORWARD 1", "TURN LEFT", "GET_POSITION", "BACKWARD 2"] * (args.commands // 4)
+    binary_commands = [(FORWARD, 0, 1), (TURN_LEFT, 0, 1), (wire.GET_POSITION, 0, 0),
+                       (BACKWARD, 0, 2)] * (args.commands // 4)
+    total = args.clients * len(text_commands)
+    print(f"{args.clients} clients x {len(text_commands)} commands")
+    print(f"{'batch':>6} {'text':>14} {'binary':>14} {'speedup':>8}")
+    for batch in args.batch:
+        text = asyncio.run(run_protocol(text_client, server.port, args.clients, text_commands, batch))
+        binary = asyncio.run(run_protocol(binary_client, server.port, args.clients, binary_commands, batch))
+        print(f"{batch:>6} {total / text:>10,.0f}/s {total / binary:>10,.0f}/s {text / binary:>7.1f}x")
+    server.stop()
+    runner.stop()
+    print(f"bytes per command: text ~{sum(len(c) + 1 for c in text_commands) / len(text_commands):.1f} out, "
+          f"binary {wire.COMMAND.size} out / {wire.RESULT.size} back plus a {wire.HEADER.size} byte header per batch")
+
+
+def bench_subscribe(args):
+    """N subscribers following one robot: ordered, complete, and bounded under slow readers"""
+    simulation = Simulation()
+    runner = SimulationRunner(simulation, tick_interval=args.tick_ms / 1000)
+    server = GridServer("127.0.0.1", 0, simulation, on_command=runner.wake)
+    server.start()
+    runner.start()
+    results, buffered, elapsed = asyncio.run(run_subscribers(server, args.subscribers, args.slow, args.pause,
+                                                             args.steps))
+    server.stop()
+    runner.stop()
+
+    ordered = all(all(a < b for a, b in zip(ticks, ticks[1:])) for ticks in results)
+    counts = [len(ticks) for ticks in results]
+    print(f"{args.subscribers} subscribers ({args.slow} pausing {args.pause}s) following {args.steps} steps "
+          f"in {elapsed:.2f}s, {simulation.ticks} ticks")
+    print(f"events per subscriber: min {min(counts)}  mean {statistics.mean(counts):.0f}  max {max(counts)}")
+    print(f"fast subscribers: {statistics.mean(counts[args.slow:]) if args.slow < len(counts) else 0:.0f} events, "
+          f"slow subscribers: {statistics.mean(counts[:args.slow]) if args.slow else 0:.0f} events")
+    print(f"ticks strictly increasing for every subscriber: {ordered}")
+    print(f"every subscriber saw the final state: {all(ticks[-1] == simulation.ticks for ticks in results)}")
+    print(f"peak bytes buffered by the server for all subscribers: {buffered:,}")
+
+
+def legacy_drain(steps):
+    """The old queue: one string per step, drained with list.pop(0)"""
+    simulation = Simulation()
+    command_queue = ["FORWARD 1"] * steps
+    while command_queue:
+        command_queue.pop(0)
+        simulation.robot.move_forward(1)
+
+
+def run_length_drain(steps):
+    simulation = Simulation()
+    simulation.submit(FORWARD, steps)
+    simulation.run_until_idle()
+
+
+def measure(func, steps):
+    start = time.perf_counter()
+    func(steps)
+    elapsed = time.perf_counter() - start
+    # Memory is traced in a second run so tracing overhead doesn't skew the timing
+    tracemalloc.start()
+    func(steps)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def bench_queue(args):
+    """Memory and drain time of FORWARD n for the list queue vs the run-length queue"""
+    print(f"{'steps':>10}  {'list queue':>24}  {'run-length queue':>24}")
+    for steps in args.steps:
+        if steps <= args.legacy_limit:
+            elapsed, peak = measure(legacy_drain, steps)
+            legacy = f"{elapsed:8.3f}s {peak / 1024:10,.0f} KiB"
+        else:
+            legacy = "skipped (quadratic)"
+        elapsed, peak = measure(run_length_drain, steps)
+        print(f"{steps:>10,}  {legacy:>24}  {elapsed:8.3f}s {peak / 1024:10,.0f} KiB")
+
+
+def random_plan(commands, max_steps):
+    plan = []
+    for _ in range(commands):
+        opcode = random.randrange(4)
+        plan.append((opcode, random.randint(1, max_steps) if opcode < 2 else 1))
+    return plan
+
+
+def bench_plan(args):
+    """Closed-form plan execution vs stepping the simulation"""
+    random.seed(0)
+    plan = random_plan(args.commands, args.max_steps)
+
+    simulation = Simulation()
+    start = time.perf_counter()
+    for opcode, count in plan:
+        simulation.submit(opcode, count)
+    steps = simulation.run_until_idle()
+    stepped = time.perf_counter() - start
+
+    start = time.perf_counter()
+    pose = execute_plan(plan, 7, 7, 0)
+    closed_form = time.perf_counter() - start
+    assert pose == simulation.pose
+
+    start = time.perf_counter()
+    execute_plan(plan, 7, 7, 0, trajectory=True)
+    trajectory = time.perf_counter() - start
+
+    print(f"plan of {args.commands} commands, {steps:,} steps")
+    print(f"stepped simulation: {stepped * 1000:9.2f} ms")
+    print(f"closed form:        {closed_form * 1000:9.2f} ms  ({stepped / closed_form:,.0f}x)")
+    print(f"full trajectory:    {trajectory * 1000:9.2f} ms")
+
+    plans = [random_plan(20, 10) for _ in range(args.plans)]
+    start = time.perf_counter()
+    for candidate in plans:
+        execute_plan(candidate, 7, 7, 0)
+    elapsed = time.perf_counter() - start
+    print(f"scored {args.plans:,} 20-command plans: {args.plans / elapsed:,.0f} plans/s")
+
+
+def bench_fleet(args):
+    """Simulation ticks per second as the fleet grows"""
+    print(f"{'robots':>10}  {'long runs':>16}  {'new run every step':>20}")
+    for robots in args.robots:
+        rates = []
+        for plan in ([(FORWARD, args.ticks)],
+                     [(FORWARD, 1), (TURN_LEFT, 1), (BACKWARD, 1), (TURN_RIGHT, 1)] * (args.ticks // 4)):
+            simulation = Simulation(robots)
+            for robot in range(robots):
+                for opcode, count in plan:
+                    simulation.submit(opcode, count, robot)
+            simulation.tick()  # Drain the inbox outside the timed loop
+            start = time.perf_counter()
+            for _ in range(args.ticks - 1):
+                simulation.tick()
+            rates.append((args.ticks - 1) / (time.perf_counter() - start))
+        print(f"{robots:>10,}  {rates[0]:>10,.0f} tick/s  {rates[1]:>14,.0f} tick/s")
+
+
+def line_item_scene(size):
+    """The old scene: one QGraphicsLine item per grid line"""
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtGui import QBrush, QColor, QPen
+    from PyQt5.QtWidgets import QGraphicsScene
+
+    scene = QGraphicsScene(0, 0, size * 40, size * 40)
+    scene.setBackgroundBrush(QBrush(QColor(25, 25, 25)))
+    pen = QPen(Qt.white)
+    for i in range(0, size * 40 + 1, 40):
+        scene.addLine(i, 0, i, size * 40, pen)
+        scene.addLine(0, i, size * 40, i, pen)
+    return scene
+
+
+def bench_render(args):
+    """Frame time of the grid view across grid sizes, at 1:1 zoom and zoomed out to fit"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import Qt
+    from PyQt5.QtWidgets import QApplication, QGraphicsView
+    from window import GridScene
+
+    app = QApplication.instance() or QApplication([])
+    print(f"{'grid':>16}  {'scene':>10}  {'1:1 frame':>12}  {'fit frame':>12}")
+    for size in args.sizes:
+        scenes = [("tiles", lambda: GridScene(size, size))]
+        if size <= args.legacy_limit:
+            scenes.append(("line items", lambda: line_item_scene(size)))
+        for name, make_scene in scenes:
+            scene = make_scene()
+            view = QGraphicsView(scene)
+            view.resize(600, 600)
+            view.show()
+            frame_times = []
+            for fit in (False, True):
+                if fit:
+                    view.fitInView(scene.sceneRect(), Qt.KeepAspectRatio)
+                view.centerOn(scene.sceneRect().center())
+                app.processEvents()
+                start = time.perf_counter()
+                for _ in range(args.frames):
+                    view.viewport().repaint()
+                frame_times.append((time.perf_counter() - start) / args.frames)
+            view.close()
+            grid = f"{size:,}x{size:,}"
+            print(f"{grid:>16}  {name:>10}  {frame_times[0] * 1000:9.3f} ms  {frame_times[1] * 1000:9.3f} ms")
+
+
+def bench_frames(args):
+    """GUI thread CPU per displayed frame while the robot moves as fast as the simulation can step it"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtCore import QEvent, QObject, QTimer
+    from PyQt5.QtWidgets import QApplication
+    from window import MainWindow
+
+    class PaintCounter(QObject):
+        def __init__(self):
+            super().__init__()
+            self.paints = 0
+
+        def eventFilter(self, watched, event):
+            if event.type() == QEvent.Paint:
+                self.paints += 1
+            return False
+
+    app = QApplication.instance() or QApplication([])
+    print(f"{'grid':>12}  {'frame rate':>10}  {'frames/s':>9}  {'GUI CPU':>8}  {'CPU/frame':>10}  {'steps/s':>10}")
+    for size in args.sizes:
+        for frame_rate in args.frame_rates:
+            window = MainWindow(tick_interval=args.tick_ms / 1000, width=size, height=size, port=0, frame_rate=frame_rate)
+            counter = PaintCounter()
+            window.view.viewport().installEventFilter(counter)
+            window.show()
+            app.processEvents()
+            counter.paints = 0
+            ticks = window.simulation.ticks
+            # Long runs that keep turning, so both moves and rotations are drawn
+            for _ in range(20000):
+                window.simulation.submit(FORWARD, 50)
+                window.simulation.submit(TURN_RIGHT, 1)
+            window.runner.wake()
+            cpu = time.thread_time()
+            start = time.perf_counter()
+            QTimer.singleShot(int(args.seconds * 1000), app.quit)
+            app.exec_()
+            elapsed = time.perf_counter() - start
+            cpu = time.thread_time() - cpu
+            ticks = window.simulation.ticks - ticks
+            window.close()
+            frames = max(counter.paints, 1)
+            label = f"{frame_rate:g} Hz" if frame_rate else "every step"
+            grid = f"{size:,}x{size:,}"
+            print(f"{grid:>12}  {label:>10}  {counter.paints / elapsed:>9,.0f}  {cpu / elapsed:>7.0%}  "
+                  f"{cpu / frames * 1000:>7.3f} ms  {ticks / elapsed:>10,.0f}")
+    print("GUI CPU is the share of one core used by the GUI thread; frames are viewport repaints")
+
+
+def bench_snapshot(args):
+    """Snapshot size, the pause while a checkpoint copies the state, write time and restore time vs fleet size"""
+    occupancy = OccupancyMap(rooms_map(args.map_size)) if args.map_size else None
+    path = os.path.join(tempfile.mkdtemp(), "fleet.snap")
+    print(f"{'robots':>10}  {'size':>10}  {'per robot':>9}  {'pause':>9}  {'write':>9}  {'restore':>9}  {'first tick':>10}")
+    for robots in args.robots:
+        simulation = Simulation(robots, occupancy=occupancy)
+        # A few queued runs per robot, so the run pool is part of the state
+        for opcode, count in [(FORWARD, 5), (TURN_LEFT, 1), (BACKWARD, 3), (TURN_RIGHT, 1)]:
+            for robot in range(robots):
+                simulation.submit(opcode, count, robot)
+        simulation.tick()
+        checkpointer = snapshot.Checkpointer(simulation, path)
+        for _ in range(args.repeat):
+            simulation.tick()
+            checkpointer.checkpoint()
+        pause = checkpointer.copy_time.total / checkpointer.copy_time.count / 1e9
+        write = checkpointer.write_time.total / checkpointer.write_time.count / 1e9
+
+        restored = Simulation(1, occupancy=occupancy)
+        restore_times, tick_times = [], []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            snapshot.restore(restored, snapshot.Snapshot(path))
+            restore_times.append(time.perf_counter() - start)
+            # The first tick after a restore pages in the mapped arrays it touches
+            start = time.perf_counter()
+            restored.tick()
+            tick_times.append(time.perf_counter() - start)
+        size = os.path.getsize(path)
+        print(f"{robots:>10,}  {size / 1e6:>7.2f} MB  {size / robots:>7.0f} B  {pause * 1000:>6.2f} ms  "
+              f"{write * 1000:>6.2f} ms  {statistics.median(restore_times) * 1000:>6.2f} ms  "
+              f"{statistics.median(tick_times) * 1000:>7.2f} ms")
+    os.remove(path)
+    print("pause is how long a checkpoint holds the simulation lock; ticks continue while it writes")
+
+
+def rooms_map(size, room=50, door=4, seed=0):
+    """Walls every `room` cells with one door per wall segment: few L-shaped paths are clear"""
+    rng = np.random.default_rng(seed)
+    blocked = np.zeros((size, size), dtype=bool)
+    blocked[::room, :] = True
+    blocked[:, ::room] = True
+    for i in range(0, size, room):
+        for j in range(0, size, room):
+            offset = rng.integers(1, room - door)
+            blocked[i, j + offset:j + offset + door] = False
+            offset = rng.integers(1, room - door)
+            blocked[i + offset:i + offset + door, j] = False
+    return blocked
+
+
+def scattered_map(size, density=0.02, block=5, seed=0):
+    """Square obstacles covering about `density` of the grid"""
+    rng = np.random.default_rng(seed)
+    blocked = np.zeros((size, size), dtype=bool)
+    count = int(size * size * density / block ** 2)
+    for x, y in zip(rng.integers(0, size - block, count), rng.integers(0, size - block, count)):
+        blocked[y:y + block, x:x + block] = True
+    return blocked
+
+
+def noise_map(size, density=0.2, seed=0):
+    """Independently blocked cells, so almost every path has to weave"""
+    return np.random.default_rng(seed).random((size, size)) < density
+
+
+def bench_goto(args):
+    """Planning time for GOTO targets on large maps.
+
+    Each target is planned from several random starts. Plans that fit an
+    L-shaped path are "direct" and plans the budgeted A* search settles are
+    "A*"; otherwise the first plan to a target builds its distance field and
+    later ones reuse it. Then a fleet of one robot
+    per target is sent off at once, to show the longest tick while their
+    searches run on the planner thread.
+    """
+    if args.map:
+        maps = [(args.map, OccupancyMap.load(args.map))]
+    else:
+        maps = [(f"{name} {size}x{size}", OccupancyMap(make_map(size)))
+                for size in args.sizes
+                for name, make_map in (("rooms", rooms_map), ("scattered", scattered_map), ("noise", noise_map))]
+    rng = random.Random(0)
+    print(f"{'map':>20}  {'direct':>16}  {'A*':>16}  {'first to target':>16}  {'later to target':>16}"
+          f"  {'unreachable':>11}  {'longest tick':>12}")
+    for name, occupancy in maps:
+        planner = PathPlanner(occupancy.width, occupancy.height, occupancy.blocked)
+        free_y, free_x = np.nonzero(~occupancy.blocked)
+
+        def free_cell():
+            index = rng.randrange(len(free_x))
+            return int(free_x[index]), int(free_y[index])
+
+        times = {"direct": [], "astar": [], "first": [], "later": []}
+        for _ in range(args.targets):
+            tx, ty = free_cell()
+            for start in range(args.starts):
+                x, y = free_cell()
+                before = dict(planner.stats)
+                begin = time.perf_counter()
+                planner.plan(x, y, rng.randrange(4), tx, ty)
+                elapsed = time.perf_counter() - begin
+                kind = next((kind for kind, stat in (("direct", "direct"), ("astar", "astar"), ("first", "field_builds"))
+                             if planner.stats[stat] > before[stat]), "later")
+                times[kind].append(elapsed)
+        columns = [f"{percentile(values, 50) * 1000:6.2f}/{max(values) * 1000:6.1f} ms" if values else "-"
+                   for values in times.values()]
+
+        height, width = occupancy.blocked.shape
+        simulation = Simulation(args.targets, width, height, occupancy=occupancy)
+        for robot in range(args.targets):
+            tx, ty = free_cell()
+            simulation.submit(GOTO, ty * width + tx, robot)
+        simulation.run_until_idle()
+        longest_tick = simulation.tick_time.summary()["max"] / 1e6
+        print(f"{name:>20}  {columns[0]:>16}  {columns[1]:>16}  {columns[2]:>16}  {columns[3]:>16}"
+              f"  {planner.stats['unreachable']:>11}  {longest_tick:9.1f} ms")
+    print("times are p50/max per plan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="RobotGrid benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    load = subparsers.add_parser("load", help="concurrent clients against the TCP server")
+    load.add_argument("--clients", type=int, default=300)
+    load.add_argument("--commands", type=int, default=100, help="commands pipelined per client")
+    load.set_defaults(func=bench_load)
+
+    wire_protocol = subparsers.add_parser("wire", help="text protocol vs binary batch frames")
+    wire_protocol.add_argument("--clients", type=int, default=50)
+    wire_protocol.add_argument("--commands", type=int, default=2000, help="commands per client")
+    wire_protocol.add_argument("--batch", type=int, nargs="+", default=[1, 10, 100, 1000],
+                               help="commands written before waiting for their replies")
+    wire_protocol.set_defaults(func=bench_wire)
+
+    subscribe = subparsers.add_parser("subscribe", help="pushed state events to many subscribers")
+    subscribe.add_argument("--subscribers", type=int, default=100)
+    subscribe.add_argument("--slow", type=int, default=10, help="subscribers that stop reading for a while")
+    subscribe.add_argument("--pause", type=float, default=1.0, help="seconds a slow subscriber stops reading")
+    subscribe.add_argument("--steps", type=int, default=200000)
+    subscribe.add_argument("--tick-ms", type=float, default=0)
+    subscribe.set_defaults(func=bench_subscribe)
+
+    command_queue = subparsers.add_parser("queue", help="memory and drain time for large step counts")
+    command_queue.add_argument("--steps", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    command_queue.add_argument("--legacy-limit", type=int, default=200000,
+                               help="largest step count to run through the quadratic list queue")
+    command_queue.set_defaults(func=bench_queue)
+
+    plan = subparsers.add_parser("plan", help="closed-form batch execution of command plans")
+    plan.add_argument("--commands", type=int, default=1000)
+    plan.add_argument("--max-steps", type=int, default=100)
+    plan.add_argument("--plans", type=int, default=10000, help="number of small plans to score")
+    plan.set_defaults(func=bench_plan)
+
+    fleet = subparsers.add_parser("fleet", help="ticks per second vs fleet size")
+    fleet.add_argument("--robots", type=int, nargs="+", default=[1, 10, 100, 1000, 10000, 100000])
+    fleet.add_argument("--ticks", type=int, default=200)
+    fleet.set_defaults(func=bench_fleet)
+
+    render = subparsers.add_parser("render", help="frame time of the grid view vs grid size")
+    render.add_argument("--sizes", type=int, nargs="+", default=[15, 100, 1000, 10000, 100000])
+    render.add_argument("--frames", type=int, default=50)
+    render.add_argument("--legacy-limit", type=int, default=1000,
+                        help="largest grid to also render with one scene item per line")
+    render.set_defaults(func=bench_render)
+
+    frames = subparsers.add_parser("frames", help="GUI CPU per frame with frame-capped vs per-step redraws")
+    frames.add_argument("--sizes", type=int, nargs="+", default=[15, 1000])
+    frames.add_argument("--frame-rates", type=float, nargs="+", default=[0, 60],
+                        help="redraw caps to compare (0 = redraw on every step)")
+    frames.add_argument("--tick-ms", type=float, default=1, help="simulation tick interval")
+    frames.add_argument("--seconds", type=float, default=3)
+    frames.set_defaults(func=bench_frames)
+
+    snapshots = subparsers.add_parser("snapshot", help="checkpoint size, pause, write and restore time vs fleet size")
+    snapshots.add_argument("--robots", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    snapshots.add_argument("--map-size", type=int, default=0, help="also store a rooms map of this size")
+    snapshots.add_argument("--repeat", type=int, default=5)
+    snapshots.set_defaults(func=bench_snapshot)
+
+    goto = subparsers.add_parser("goto", help="GOTO path planning time on large obstacle maps")
+    goto.add_argument("--sizes", type=int, nargs="+", default=[1000, 2000])
+    goto.add_argument("--targets", type=int, default=10)
+    goto.add_argument("--starts", type=int, default=10, help="plans to each target from random starts")
+    goto.add_argument("--map", help="plan on this map file instead of the generated ones")
+    goto.set_defaults(func=bench_goto)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,692 @@
+import queue
+import threading
+import time
+import traceback
+from array import array
+
+import numpy as np
+
+from metrics import Metrics
+from planner import PathPlanner, PlannerThread
+
+# Default grid size
+GRID_WIDTH = 15
+GRID_HEIGHT = 15
+
+# Opcodes for queued commands; the queue holds [opcode, remaining] runs
+FORWARD, BACKWARD, TURN_LEFT, TURN_RIGHT, CENTER, GOTO = range(6)
+
+# Most steps one command can queue: the binary protocol's i32 count, which also
+# keeps the per-robot step totals far from overflowing their int64 arrays
+MAX_COUNT = 2**31 - 1
+
+# Unit moves for each heading (direction // 90): up, right, down, left
+HEADING_DX = np.array([0, 1, 0, -1])
+HEADING_DY = np.array([-1, 0, 1, 0])
+
+
+# Per-opcode effect of a single step: direction change in degrees and move sign.
+# A GOTO never steps itself: it waits until it is replaced by the runs of its path.
+OPCODE_TURN = np.array([0, 0, -90, 90, 0, 0])
+OPCODE_MOVE = np.array([1, -1, 0, 0, 0, 0])
+
+# Plain-list copies for stepping a few robots without NumPy call overhead
+HEADING_DX_LIST, HEADING_DY_LIST = HEADING_DX.tolist(), HEADING_DY.tolist()
+OPCODE_TURN_LIST, OPCODE_MOVE_LIST = OPCODE_TURN.tolist(), OPCODE_MOVE.tolist()
+SCALAR_STEP_LIMIT = 8
+
+
+class Fleet:
+    """Struct-of-arrays state for any number of robots.
+
+    Robot i is index i into flat NumPy arrays of position and direction. The
+    run each robot is currently executing lives in the `opcode`/`remaining`
+    arrays, so one step advances the whole fleet with a handful of vectorized
+    operations. Runs queued behind the active one are kept in a shared pool of
+    run arrays linked per robot from `head` to `tail`, so loading the next run
+    for every robot that just finished is vectorized too.
+
+    Moves into cells blocked in the `occupancy` map leave the robot where it
+    is. A GOTO run is a single step holding a target cell; when it becomes
+    active it is replaced by the runs of a path planned from wherever the
+    robot is by then. Paths that need a search are planned on a
+    `PlannerThread`, and the robot waits on its GOTO, without stepping, until
+    a later step picks up the path, so a search never holds up a tick.
+    """
+
+    def __init__(self, size=1, width=GRID_WIDTH, height=GRID_HEIGHT, capacity=64, occupancy=None):
+        if occupancy is not None:
+            width, height = occupancy.width, occupancy.height
+        self.size = size
+        self.width = width
+        self.height = height
+        # None without a map, or on a map with nothing blocked, so moves skip the check and
+        # nothing the size of the grid is allocated
+        self.occupancy = occupancy
+        self.blocked = occupancy.blocked if occupancy is not None and occupancy.any() else None
+        self.planner = PathPlanner(width, height, self.blocked)
+        self.plans = PlannerThread(self.planner)
+        # Robots waiting for a path search, with the (x, y, direction, target) it was started from
+        self.planning = {}
+        # Start at center of the grid, or the free cell closest to it
+        start_x, start_y = width // 2, height // 2
+        if self.blocked is not None:
+            start_x, start_y = occupancy.nearest_free(start_x, start_y) or (start_x, start_y)
+        self.x = np.full(size, start_x, dtype=np.int64)
+        self.y = np.full(size, start_y, dtype=np.int64)
+        self.direction = np.zeros(size, dtype=np.int64)  # 0=up, 90=right, 180=down, 270=left
+        self.opcode = np.zeros(size, dtype=np.int64)
+        self.remaining = np.zeros(size, dtype=np.int64)
+        # Pool of queued runs: a linked list per robot, empty when head is -1
+        self.head = np.full(size, -1, dtype=np.int64)
+        self.tail = np.full(size, -1, dtype=np.int64)
+        self.run_opcode = np.zeros(capacity, dtype=np.int64)
+        self.run_count = np.zeros(capacity, dtype=np.int64)
+        self.run_next = np.full(capacity, -1, dtype=np.int64)
+        # Free slots as a stack of machine integers, so snapshots can copy it as one block
+        self.free = array("q", range(capacity - 1, -1, -1))
+        # Target cells (y * width + x) of GOTO runs, queued and active, and how many are waiting to be planned
+        self.run_target = np.zeros(capacity, dtype=np.int64)
+        self.target = np.zeros(size, dtype=np.int64)
+        self.gotos = 0
+        # Steps in each robot's queued runs and all steps ever queued, for progress reporting
+        self.backlog = np.zeros(size, dtype=np.int64)
+        self.enqueued = np.zeros(size, dtype=np.int64)
+
+    def busy(self):
+        """True if a step has something to do; robots waiting for a path search don't count until it is done"""
+        if not self.planning:
+            return bool(self.remaining.any())
+        return int(np.count_nonzero(self.remaining)) > len(self.planning) or self.plans.ready.is_set()
+
+    def allocate(self, opcode, count):
+        if not self.free:
+            capacity = len(self.run_opcode)
+            self.run_opcode = np.concatenate([self.run_opcode, np.zeros(capacity, dtype=np.int64)])
+            self.run_count = np.concatenate([self.run_count, np.zeros(capacity, dtype=np.int64)])
+            self.run_next = np.concatenate([self.run_next, np.full(capacity, -1, dtype=np.int64)])
+            self.run_target = np.concatenate([self.run_target, np.zeros(capacity, dtype=np.int64)])
+            self.free = array("q", range(2 * capacity - 1, capacity - 1, -1))
+        slot = self.free.pop()
+        self.run_opcode[slot] = opcode
+        self.run_count[slot] = count
+        return slot
+
+    def enqueue(self, index, opcode, count):
+        """Queue `count` steps of an opcode; for GOTO, `count` is the target cell instead"""
+        target = 0
+        if opcode == GOTO:
+            target, count = count, 1
+            self.gotos += 1
+        if count <= 0:
+            return
+        self.enqueued[index] += count
+        tail = self.tail[index]
+        if tail >= 0:
+            self.backlog[index] += count
+            # Extend the last run instead of adding a new one when the opcode repeats
+            if self.run_opcode[tail] == opcode and opcode != GOTO:
+                self.run_count[tail] += count
+            else:
+                slot = self.allocate(opcode, count)
+                self.run_target[slot] = target
+                self.run_next[tail] = slot
+                self.tail[index] = slot
+        elif self.remaining[index] == 0:
+            self.opcode[index] = opcode
+            self.remaining[index] = count
+            self.target[index] = target
+        elif self.opcode[index] == opcode and opcode != GOTO:
+            self.remaining[index] += count
+        else:
+            slot = self.allocate(opcode, count)
+            self.run_target[slot] = target
+            self.head[index] = self.tail[index] = slot
+            self.backlog[index] += count
+
+    def load_next(self, finished):
+        """Make the next queued run active for robots whose run just finished"""
+        waiting = finished[self.head[finished] >= 0]
+        if not len(waiting):
+            return
+        slots = self.head[waiting]
+        self.opcode[waiting] = self.run_opcode[slots]
+        self.remaining[waiting] = self.run_count[slots]
+        self.target[waiting] = self.run_target[slots]
+        self.backlog[waiting] -= self.run_count[slots]
+        following = self.run_next[slots]
+        self.head[waiting] = following
+        self.tail[waiting[following < 0]] = -1
+        self.run_next[slots] = -1
+        self.free.frombytes(slots.tobytes())
+
+    def step(self):
+        """Advance every robot with an active run by one step; returns False if all are idle"""
+        active = np.flatnonzero(self.remaining)
+        gotos = self.gotos
+        if gotos:
+            if self.planning:
+                self.collect_paths()
+            for index in active[self.opcode[active] == GOTO].tolist():
+                if index not in self.planning:
+                    self.expand_goto(index)
+            # Robots still on a GOTO are waiting for a search
+            active = active[self.opcode[active] != GOTO]
+        if not len(active):
+            # A GOTO with nothing to drive still ends in a tick, so the change is published
+            return self.gotos < gotos
+        if len(active) <= SCALAR_STEP_LIMIT:
+            # Vectorizing only pays off for larger fleets
+            for index in active.tolist():
+                self.step_one(index)
+            return True
+        # Slicing is much cheaper than fancy indexing when the whole fleet is moving
+        selection = slice(None) if len(active) == self.size else active
+        opcode = self.opcode[selection]
+        direction = self.direction[selection]
+        move = OPCODE_MOVE[opcode]
+        heading = direction // 90
+        x = (self.x[selection] + HEADING_DX[heading] * move) % self.width
+        y = (self.y[selection] + HEADING_DY[heading] * move) % self.height
+        centering = opcode == CENTER
+        if centering.any():
+            x[centering] = self.width // 2
+            y[centering] = self.height // 2
+        if self.blocked is not None:
+            # Robots that would end up in a blocked cell stay put
+            stopped = self.blocked[y, x]
+            if stopped.any():
+                x[stopped] = self.x[selection][stopped]
+                y[stopped] = self.y[selection][stopped]
+        self.x[selection] = x
+        self.y[selection] = y
+        self.direction[selection] = (direction + OPCODE_TURN[opcode]) % 360
+        remaining = self.remaining[selection] - 1
+        self.remaining[selection] = remaining
+        self.load_next(active[remaining == 0])
+        return True
+
+    def step_one(self, index):
+        opcode = int(self.opcode[index])
+        direction = int(self.direction[index])
+        move = OPCODE_MOVE_LIST[opcode]
+        if opcode == CENTER or move:
+            if opcode == CENTER:
+                x, y = self.width // 2, self.height // 2
+            else:
+                heading = direction // 90
+                x = (int(self.x[index]) + HEADING_DX_LIST[heading] * move) % self.width
+                y = (int(self.y[index]) + HEADING_DY_LIST[heading] * move) % self.height
+            if self.blocked is None or not self.blocked[y, x]:
+                self.x[index] = x
+                self.y[index] = y
+        else:
+            self.direction[index] = (direction + OPCODE_TURN_LIST[opcode]) % 360
+        remaining = int(self.remaining[index]) - 1
+        self.remaining[index] = remaining
+        if remaining == 0:
+            slot = int(self.head[index])
+            if slot >= 0:
+                self.opcode[index] = self.run_opcode[slot]
+                self.remaining[index] = self.run_count[slot]
+                self.target[index] = self.run_target[slot]
+                self.backlog[index] -= self.run_count[slot]
+                following = int(self.run_next[slot])
+                self.head[index] = following
+                if following < 0:
+                    self.tail[index] = -1
+                self.run_next[slot] = -1
+                self.free.append(slot)
+
+    def expand_goto(self, index):
+        """Replace a robot's active GOTO with the runs of a path to its target, or start a search for one"""
+        x, y, direction = self.pose(index)
+        target = int(self.target[index])
+        tx, ty = target % self.width, target // self.width
+        found, legs = self.planner.plan_without_search(x, y, direction // 90, tx, ty)
+        if found:
+            self.follow_path(index, legs)
+        else:
+            self.planning[index] = (x, y, direction, target)
+            self.plans.request((index, x, y, direction, target), x, y, direction // 90, tx, ty)
+
+    def collect_paths(self):
+        """Follow the paths of finished searches"""
+        for (index, *start), legs in self.plans.results():
+            if self.planning.get(index) != tuple(start):
+                continue  # Dropped by a restore, or started again after the robot moved
+            del self.planning[index]
+            if (*self.pose(index), int(self.target[index])) == tuple(start) and self.opcode[index] == GOTO:
+                self.follow_path(index, legs)
+            # Otherwise the robot was moved while it waited, and its GOTO is planned again
+
+    def follow_path(self, index, legs):
+        """Replace a robot's active GOTO with the runs that drive `legs`; None means there is no path"""
+        self.gotos -= 1
+        x, y, direction = self.pose(index)
+        if legs is None:
+            target = int(self.target[index])
+            print(f"No path for R{index} from ({x}, {y}) to ({target % self.width}, {target // self.width})")
+        runs = path_runs(legs or [], direction)
+        if not runs:
+            # Nothing to drive: the GOTO is done without taking a step
+            self.remaining[index] = 0
+            self.load_next(np.array([index]))
+            return
+        opcode, count = runs[0]
+        self.opcode[index] = opcode
+        self.remaining[index] = count
+        # The rest of the path goes in front of whatever was queued behind the GOTO
+        following = int(self.head[index])
+        for opcode, count in reversed(runs[1:]):
+            slot = self.allocate(opcode, count)
+            self.run_next[slot] = following
+            if following < 0:
+                self.tail[index] = slot
+            following = slot
+            self.backlog[index] += count
+        self.head[index] = following
+        self.enqueued[index] += sum(count for _, count in runs) - 1
+
+    def pose(self, index):
+        return int(self.x[index]), int(self.y[index]), int(self.direction[index])
+
+    def progress(self, index):
+        """(steps still queued, steps completed) for a robot"""
+        queued = int(self.remaining[index] + self.backlog[index])
+        return queued, int(self.enqueued[index]) - queued
+
+
+class Robot:
+    """A single robot: a view onto one index of a Fleet"""
+
+    def __init__(self, fleet=None, index=0):
+        self.fleet = fleet or Fleet(1)
+        self.index = index
+
+    @property
+    def x(self):
+        return int(self.fleet.x[self.index])
+
+    @x.setter
+    def x(self, value):
+        self.fleet.x[self.index] = value
+
+    @property
+    def y(self):
+        return int(self.fleet.y[self.index])
+
+    @y.setter
+    def y(self, value):
+        self.fleet.y[self.index] = value
+
+    @property
+    def direction(self):
+        return int(self.fleet.direction[self.index])
+
+    @direction.setter
+    def direction(self, value):
+        self.fleet.direction[self.index] = value
+
+    def move_forward(self, n):
+        if self.direction == 0:    self.y -= n  # Up
+        elif self.direction == 90:  self.x += n  # Right
+        elif self.direction == 180: self.y += n  # Down
+        elif self.direction == 270: self.x -= n  # Left
+        self.wrap_position()
+
+    def move_backward(self, n):
+        if self.direction == 0:    self.y += n
+        elif self.direction == 90:  self.x -= n
+        elif self.direction == 180: self.y -= n
+        elif self.direction == 270: self.x += n
+        self.wrap_position()
+
+    def turn_left(self):
+        self.direction = (self.direction - 90) % 360
+
+    def turn_right(self):
+        self.direction = (self.direction + 90) % 360
+
+    def center(self):
+        """Jump to the middle of the grid; like the CENTER opcode, stay put if that cell is blocked"""
+        x, y = self.fleet.width // 2, self.fleet.height // 2
+        if self.fleet.blocked is None or not self.fleet.blocked[y, x]:
+            self.x = x
+            self.y = y
+
+    def wrap_position(self):
+        self.x = self.x % self.fleet.width
+        self.y = self.y % self.fleet.height
+
+    def preview_plan(self, plan, trajectory=False):
+        """Return the pose (and optionally trajectory) a plan would end in, without moving"""
+        return execute_plan(plan, self.x, self.y, self.direction,
+                            self.fleet.width, self.fleet.height, trajectory=trajectory)
+
+    def apply_plan(self, plan):
+        """Jump straight to the pose at the end of a plan"""
+        self.x, self.y, self.direction = execute_plan(plan, self.x, self.y, self.direction,
+                                                      self.fleet.width, self.fleet.height)
+
+
+def path_runs(legs, direction):
+    """Runs that drive a planned path of (heading index, cells) legs, starting out facing `direction`"""
+    runs = []
+    heading = direction // 90
+    for leg_heading, length in legs:
+        if leg_heading % 2 != heading % 2:
+            # Turn to face along the leg so it is driven forward
+            runs.append((TURN_RIGHT if (leg_heading - heading) % 4 == 1 else TURN_LEFT, 1))
+            heading = leg_heading
+        runs.append((FORWARD if leg_heading == heading else BACKWARD, length))
+    return runs
+
+
+def parse_robot(command, robots=1):
+    """Split an optional `R<id>` prefix off a command; returns (robot, rest)"""
+    parts = command.split(None, 1)
+    if parts and parts[0][:1] in "Rr" and parts[0][1:].isdigit():
+        robot = int(parts[0][1:])
+        if robot >= robots:
+            raise ValueError(f"Unknown robot: {parts[0]}")
+        return robot, parts[1] if len(parts) > 1 else ""
+    return 0, command
+
+
+def parse_action(command, width=GRID_WIDTH, height=GRID_HEIGHT):
+    """Parse an action command into (opcode, count); raises ValueError for invalid commands.
+
+    For `GOTO x y` the count is the target cell, y * width + x.
+    """
+    parts = command.split()
+    cmd = parts[0].upper() if parts else ""
+    if cmd == "TURN" and len(parts) == 2:
+        dir = parts[1].upper()
+        if dir == "LEFT":
+            return TURN_LEFT, 1
+        elif dir == "RIGHT":
+            return TURN_RIGHT, 1
+        raise ValueError(f"Invalid turn direction: {dir}")
+    elif cmd in ["FORWARD", "BACKWARD"] and len(parts) == 2:
+        try:
+            steps = int(parts[1])
+        except ValueError:
+            raise ValueError(f"Invalid steps for {cmd}: {parts[1]}") from None
+        if not 1 <= steps <= MAX_COUNT:
+            raise ValueError(f"Steps for {cmd} must be between 1 and {MAX_COUNT}: {steps}")
+        return (FORWARD if cmd == "FORWARD" else BACKWARD), steps
+    elif cmd == "CENTER" and len(parts) == 1:
+        return CENTER, 1
+    elif cmd == "GOTO" and len(parts) == 3:
+        try:
+            x, y = int(parts[1]), int(parts[2])
+        except ValueError:
+            raise ValueError(f"Invalid coordinates for GOTO: {parts[1]} {parts[2]}") from None
+        if not (0 <= x < width and 0 <= y < height):
+            raise ValueError(f"GOTO target ({x}, {y}) is outside the {width}x{height} grid")
+        return GOTO, y * width + x
+    raise ValueError(f"Unknown command: {command}")
+
+
+def parse_plan(lines):
+    """Parse command lines into an (n, 2) array of [opcode, count]; invalid lines are skipped.
+
+    GOTO lines are skipped too: their paths depend on the map, not just the plan.
+    """
+    runs = []
+    for line in lines:
+        try:
+            opcode, count = parse_action(line)
+        except ValueError:
+            continue
+        if opcode != GOTO:
+            runs.append((opcode, count))
+    return np.array(runs, dtype=np.int64).reshape(-1, 2)
+
+
+def execute_plan(plan, x, y, direction, width=GRID_WIDTH, height=GRID_HEIGHT, trajectory=False):
+    """Compute the outcome of a whole plan in closed form.
+
+    `plan` is a sequence (or (n, 2) array) of [opcode, count] runs. Turns are
+    multiples of 90 degrees and the grid is a torus, so the heading during each
+    run is a cumulative sum of turns and the final position is the start plus
+    the sum of every run's displacement, wrapped once at the end. CENTER
+    restarts that sum from the middle of the grid. Obstacles are not
+    considered, so this only matches the simulation on an empty map.
+
+    Returns the final (x, y, direction). With `trajectory=True` it instead
+    returns an (steps + 1, 3) array holding the pose after every single step,
+    matching what the animated simulation would visit cell by cell.
+    """
+    plan = np.asarray(plan, dtype=np.int64).reshape(-1, 2)
+    opcodes = plan[:, 0]
+    counts = np.maximum(plan[:, 1], 0)
+    turns = OPCODE_TURN[opcodes] // 90
+    moves = OPCODE_MOVE[opcodes]
+    heading = direction // 90
+
+    if trajectory:
+        # Expand runs to single steps; a move keeps the heading left by the steps before it
+        step_headings = (heading + np.cumsum(np.repeat(turns, counts))) % 4
+        step_moves = np.repeat(moves, counts)
+        step_x = x + np.cumsum(HEADING_DX[step_headings] * step_moves)
+        step_y = y + np.cumsum(HEADING_DY[step_headings] * step_moves)
+        step_centers = np.repeat(opcodes == CENTER, counts)
+        if step_centers.any():
+            # Every step after a CENTER is offset so that the CENTER step lands in the middle
+            last_center = np.maximum.accumulate(np.where(step_centers, np.arange(len(step_moves)), -1))
+            after = last_center >= 0
+            step_x[after] += (width // 2 - step_x[last_center[after]])
+            step_y[after] += (height // 2 - step_y[last_center[after]])
+        poses = np.empty((len(step_moves) + 1, 3), dtype=np.int64)
+        poses[0] = (x, y, direction)
+        poses[1:, 0] = step_x % width
+        poses[1:, 1] = step_y % height
+        poses[1:, 2] = step_headings * 90
+        return poses
+
+    # Heading in force during each run is the sum of all turns before it
+    turn_totals = np.cumsum(turns * counts)
+    run_headings = (heading + turn_totals - turns * counts) % 4
+    distances = moves * counts
+    centers = np.flatnonzero((opcodes == CENTER) & (counts > 0))
+    if len(centers):
+        # Only moves after the last CENTER matter
+        x, y = width // 2, height // 2
+        distances[:centers[-1] + 1] = 0
+    final_x = int((x + np.sum(HEADING_DX[run_headings] * distances)) % width)
+    final_y = int((y + np.sum(HEADING_DY[run_headings] * distances)) % height)
+    final_heading = int((heading + (turn_totals[-1] if len(turn_totals) else 0)) % 4)
+    return final_x, final_y, final_heading * 90
+
+
+class Simulation:
+    """The Qt-free simulation core: a fleet of robots and their pending commands.
+
+    Queued commands are run-length encoded: `FORWARD 1000000` is a single
+    [opcode, remaining] run that is decremented in place, one cell per tick,
+    so memory stays constant and draining is linear. Each tick advances every
+    busy robot by one step at once. Commands may be submitted from any thread;
+    `tick` is called by whichever driver owns the simulation (a
+    SimulationRunner, or a plain loop when replaying scripts). Observers are
+    called after every step with the simulation, on the thread that ran the
+    tick. Tick times and how many commands each tick picked up are recorded
+    in `metrics`.
+    """
+
+    def __init__(self, robots=1, width=GRID_WIDTH, height=GRID_HEIGHT, occupancy=None):
+        self.fleet = Fleet(robots, width, height, occupancy=occupancy)
+        self.robot = Robot(self.fleet, 0)
+        self.inbox = queue.SimpleQueue()
+        self.lock = threading.Lock()
+        self.observers = []
+        self.ticks = 0
+        self.metrics = Metrics()
+        self.tick_time = self.metrics.histogram("tick_ns")
+        self.queue_depth = self.metrics.histogram("queue_depth")
+        self.metrics.gauges.update(robots=lambda: self.fleet.size, queued_steps=self.queued_steps,
+                                   planner=lambda: dict(self.fleet.planner.stats))
+        self.publish()
+
+    def add_observer(self, callback):
+        self.observers.append(callback)
+
+    def submit(self, opcode, count=1, robot=0):
+        """Queue `count` steps of an opcode for a robot; safe to call from any thread"""
+        self.inbox.put((robot, opcode, count))
+
+    def has_pending(self):
+        return self.fleet.busy() or not self.inbox.empty()
+
+    def queued_steps(self):
+        """Steps queued across the fleet plus commands not yet picked up; walks the whole fleet"""
+        with self.lock:
+            return int(self.fleet.remaining.sum() + self.fleet.backlog.sum()) + self.inbox.qsize()
+
+    def publish(self):
+        # Publish robot 0's pose as one tuple so other threads never see a half-updated position
+        self.pose = self.fleet.pose(0)
+        for callback in self.observers:
+            callback(self)
+
+    def get_pose(self, robot=0):
+        if robot == 0:
+            return self.pose
+        with self.lock:
+            return self.fleet.pose(robot)
+
+    def drain_inbox(self, discard=False):
+        """Move commands handed over by other threads into the fleet's queues; call with the lock held"""
+        received = 0
+        while True:
+            try:
+                robot, opcode, count = self.inbox.get_nowait()
+            except queue.Empty:
+                return received
+            if not discard:
+                self.fleet.enqueue(robot, opcode, count)
+            received += 1
+
+    def tick(self):
+        """Advance every busy robot by one step; returns False when there was nothing to do"""
+        start = time.perf_counter_ns()
+        with self.lock:
+            received = self.drain_inbox()
+            if received:
+                self.queue_depth.record(received)
+            if not self.fleet.step():
+                return False
+            self.ticks += 1
+        self.publish()
+        self.tick_time.record(time.perf_counter_ns() - start)
+        return True
+
+    def center(self, robot=0):
+        with self.lock:
+            Robot(self.fleet, robot).center()
+        self.publish()
+
+    def run_until_idle(self):
+        """Run every queued step back to back, waiting out path searches; returns the number of ticks executed"""
+        steps = 0
+        while True:
+            if self.tick():
+                steps += 1
+            elif self.fleet.planning:
+                self.fleet.plans.wait()
+            else:
+                return steps
+
+
+class SimulationRunner:
+    """Drives a Simulation from a background thread at a fixed tick interval.
+
+    A tick interval of zero runs queued commands as fast as the CPU allows.
+    The thread sleeps while the queue is empty, or every busy robot is
+    waiting for a path, and is woken by `wake`, which finished path searches
+    call too. How late each timed tick starts is recorded in the simulation's
+    metrics.
+    """
+
+    def __init__(self, simulation, tick_interval=0.5):
+        self.simulation = simulation
+        self.tick_interval = tick_interval
+        self.wakeup = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+        simulation.fleet.plans.on_ready = self.wake
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="SimulationRunner", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def _run(self):
+        lag = self.simulation.metrics.histogram("tick_lag_ns")
+        interval_ns = int(self.tick_interval * 1e9)
+        while not self.stopping.is_set():
+            if not self.simulation.has_pending():
+                self.wakeup.wait()
+                self.wakeup.clear()
+                continue
+            if self.tick_interval > 0:
+                deadline = time.perf_counter_ns() + interval_ns
+                if self.stopping.wait(self.tick_interval):
+                    break
+                lag.record(max(0, time.perf_counter_ns() - deadline))
+            try:
+                self.simulation.tick()
+            except Exception:
+                # A bad command must not stop the simulation for every client
+                self.simulation.metrics.counters["tick_errors"] += 1
+                traceback.print_exc()
+
+
+def run_script(lines, simulation=None):
+    """Run a command script to completion without any delay and return the simulation"""
+    simulation = simulation or Simulation()
+    for line in lines:
+        command = line.strip()
+        if not command:
+            continue
+        try:
+            robot, command = parse_robot(command, simulation.fleet.size)
+            opcode, count = parse_action(command, simulation.fleet.width, simulation.fleet.height)
+        except ValueError as e:
+            print(e)
+        else:
+            simulation.submit(opcode, count, robot)
+    simulation.run_until_idle()
+    return simulation
+
+
+def run_headless(host="127.0.0.1", port=12345, tick_interval=0.5, robots=1,
+                 width=GRID_WIDTH, height=GRID_HEIGHT, occupancy=None, **server_options):
+    """Serve the grid protocol without a display until interrupted; `server_options` go to GridServer"""
+    from server import GridServer
+
+    simulation = Simulation(robots, width, height, occupancy)
+    width, height = simulation.fleet.width, simulation.fleet.height
+    runner = SimulationRunner(simulation, tick_interval)
+    server = GridServer(host, port, simulation, on_command=runner.wake, **server_options)
+    server.start()
+    runner.start()
+    print(f"Headless RobotGrid listening on {host}:{server.port} "
+          f"({width}x{height} grid, {robots} robot{'s' if robots != 1 else ''}, tick {tick_interval * 1000:g} ms)")
+    try:
+        # Waiting on an event rather than sleeping keeps this thread out of profiles as idle
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        runner.stop()
@@ -1,212 +1,75 @@
 import sys
 import os
-from PyQt5.QtWidgets import QApplication, QMainWindow, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QPushButton, QVBoxLayout, QWidget, QLabel
-from PyQt5.QtCore import Qt, QTimer
-from PyQt5.QtGui import QPen, QBrush, QColor, QPalette, QPixmap, QPainter
-from PyQt5.QtNetwork import QTcpServer, QHostAddress
-
-class Robot:
-    def __init__(self):
-        self.x = 7  # Start at center of 15x15 grid (0 to 14)
-        self.y = 7
-        self.direction = 0  # 0=north (up), 90=east (right), 180=south (down), 270=west (left)
-
-    def move_forward(self, n):
-        if self.direction == 0:    self.y -= n  # Up
-        elif self.direction == 90:  self.x += n  # Right
-        elif self.direction == 180: self.y += n  # Down
-        elif self.direction == 270: self.x -= n  # Left
-        self.wrap_position()
-
-    def move_backward(self, n):
-        if self.direction == 0:    self.y += n
-        elif self.direction == 90:  self.x -= n
-        elif self.direction == 180: self.y -= n
-        elif self.direction == 270: self.x += n
-        self.wrap_position()
-
-    def turn_left(self):
-        self.direction = (self.direction - 90) % 360
-
-    def turn_right(self):
-        self.direction = (self.direction + 90) % 360
-
-    def center(self):
-        self.x = 7
-        self.y = 7
-
-    def wrap_position(self):
-        self.x = self.x % 15
-        self.y = self.y % 15
-
-class MainWindow(QMainWindow):
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("Robot Display")
-        self.setGeometry(100, 100, 620, 650)  # Fits 600x600 scene + controls
-
-        # Dark mode palette
-        palette = QPalette()
-        palette.setColor(QPalette.Window, QColor(53, 53, 53))
-        palette.setColor(QPalette.WindowText, Qt.white)
-        palette.setColor(QPalette.Base, QColor(25, 25, 25))
-        palette.setColor(QPalette.Text, Qt.white)
-        palette.setColor(QPalette.Button, QColor(53, 53, 53))
-        palette.setColor(QPalette.ButtonText, Qt.white)
-        self.setPalette(palette)
-
-        # Central widget and layout
-        central_widget = QWidget()
-        self.setCentralWidget(central_widget)
-        layout = QVBoxLayout()
-        central_widget.setLayout(layout)
-
-        # Graphics view and scene
-        self.view = QGraphicsView()
-        self.scene = QGraphicsScene(0, 0, 600, 600)  # 15x15 grid, 40 units/cell
-        self.scene.setBackgroundBrush(QBrush(QColor(25, 25, 25)))
-        self.view.setScene(self.scene)
-        layout.addWidget(self.view)
-
-        # Draw 15x15 grid
-        pen = QPen(Qt.white)
-        for i in range(0, 601, 40):
-            self.scene.addLine(i, 0, i, 600, pen)
-            self.scene.addLine(0, i, 600, i, pen)
-
-        # Initialize robot with icon
-        self.robot = Robot()
-        self.robot_item = QGraphicsPixmapItem()
-        self.scene.addItem(self.robot_item)
-
-        # Load robot image
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        image_path = os.path.join(script_dir, "robot.jpg")
-        pixmap = QPixmap(image_path)
-        if pixmap.isNull():
-            print(f"Error: {image_path} not found, using default image")
-            pixmap = QPixmap(40, 40)
-            pixmap.fill(Qt.transparent)
-            painter = QPainter(pixmap)
-            painter.setBrush(QBrush(Qt.blue))
-            painter.drawEllipse(0, 0, 40, 40)
-            painter.end()
-            self.robot_item.setPixmap(pixmap)
-            self.robot_item.setTransformOriginPoint(20, 20)
-        else:
-            pixmap = pixmap.scaled(40, 40, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-            self.robot_item.setPixmap(pixmap)
-            self.robot_item.setTransformOriginPoint(pixmap.width() / 2, pixmap.height() / 2)
-
-        # Set initial position and rotation
-        w = self.robot_item.pixmap().width()
-        h = self.robot_item.pixmap().height()
-        pos_x = self.robot.x * 40 + 20 - w / 2
-        pos_y = self.robot.y * 40 + 20 - h / 2
-        self.robot_item.setPos(pos_x, pos_y)
-        self.robot_item.setRotation(self.robot.direction)
-
-        # Center button
-        self.center_button = QPushButton("Center Robot")
-        self.center_button.clicked.connect(self.on_center_clicked)
-        layout.addWidget(self.center_button)
-
-        # Status label
-        direction_text = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}[self.robot.direction]
-        self.status_label = QLabel(f"Grid: 15x15 | Position: ({self.robot.x}, {self.robot.y}), Facing: {direction_text}")
-        layout.addWidget(self.status_label)
-
-        # TCP server
-        self.server = QTcpServer(self)
-        if not self.server.listen(QHostAddress("127.0.0.1"), 12345):
-            print("Failed to start server")
-            sys.exit(1)
-        self.server.newConnection.connect(self.handle_connection)
-
-        # Command queue and timer
-        self.command_queue = []
-        self.timer = QTimer(self)
-        self.timer.setInterval(500)  # 500ms delay between commands
-        self.timer.timeout.connect(self.process_next_command)
-
-    def update_robot(self):
-        if not self.robot_item.pixmap().isNull():
-            w = self.robot_item.pixmap().width()
-            h = self.robot_item.pixmap().height()
-            pos_x = self.robot.x * 40 + 20 - w / 2
-            pos_y = self.robot.y * 40 + 20 - h / 2
-            self.robot_item.setPos(pos_x, pos_y)
-            self.robot_item.setRotation(self.robot.direction)
-
-            # Update status label
-            direction_text = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}[self.robot.direction]
-            self.status_label.setText(f"Grid: 15x15 | Position: ({self.robot.x}, {self.robot.y}), Facing: {direction_text}")
-
-    def on_center_clicked(self):
-        self.robot.center()
-        self.update_robot()
-
-    def handle_connection(self):
-        client_socket = self.server.nextPendingConnection()
-        client_socket.waitForReadyRead()
-        data = client_socket.readAll().data().decode()
-        commands = [cmd.strip() for cmd in data.splitlines() if cmd.strip()]
-        for command in commands:
-            if command.upper() == "GET_DIMENSIONS":
-                client_socket.write("15 15\n".encode())
-            elif command.upper() == "GET_POSITION":
-                response = f"{self.robot.x} {self.robot.y} {self.robot.direction}\n"
-                client_socket.write(response.encode())
+import argparse
+from engine import GRID_HEIGHT, GRID_WIDTH, Fleet, Robot, Simulation, parse_plan, run_headless, run_script
+from occupancy import OccupancyMap
+from snapshot import Snapshot
+
+# The window and Qt are only imported when a window is opened, so --script and
+# --headless run without PyQt5 or Qt's system libraries
+
+def main():
+    parser = argparse.ArgumentParser(description="Robot grid simulation and display")
+    parser.add_argument("--headless", action="store_true", help="run the simulation and server without a window")
+    parser.add_argument("--tick-ms", type=float, default=500,
+                        help="delay between simulation steps in milliseconds (0 = as fast as possible)")
+    parser.add_argument("--robots", type=int, default=1, help="number of robots in the fleet (robot 0 is displayed)")
+    parser.add_argument("--width", type=int, default=GRID_WIDTH, help="grid width in cells")
+    parser.add_argument("--height", type=int, default=GRID_HEIGHT, help="grid height in cells")
+    parser.add_argument("--map", help="load obstacles from a text map file (sets the grid size)")
+    parser.add_argument("--port", type=int, default=12345, help="TCP port to listen on (0 = any free port)")
+    parser.add_argument("--script", help="run a command script at full speed, print the final pose and exit")
+    parser.add_argument("--instant", action="store_true",
+                        help="with --script, compute the final pose in closed form instead of stepping")
+    parser.add_argument("--frame-rate", type=float,
+                        help="most redraws of the robot per second (0 = redraw on every step; default 60)")
+    parser.add_argument("--metrics", help="append a JSON metrics snapshot to this file periodically")
+    parser.add_argument("--metrics-interval", type=float, default=10, help="seconds between metrics snapshots")
+    parser.add_argument("--profile", help="sample stacks for the whole run and write them to this file on exit")
+    parser.add_argument("--snapshot", help="checkpoint the simulation to this file periodically and on exit")
+    parser.add_argument("--snapshot-interval", type=float, default=10, help="seconds between checkpoints")
+    parser.add_argument("--restore", action="store_true",
+                        help="resume from the --snapshot file if it exists (its grid, map and fleet size win)")
+    args = parser.parse_args()
+    tick_interval = args.tick_ms / 1000
+    if args.restore and not args.snapshot:
+        parser.error("--restore needs --snapshot")
+    server_options = {"metrics_path": args.metrics, "metrics_interval": args.metrics_interval,
+                      "profile_path": args.profile, "snapshot_path": args.snapshot,
+                      "snapshot_interval": args.snapshot_interval, "restore": args.restore}
+    if args.map and args.instant:
+        parser.error("--instant ignores obstacles and can't be used with --map")
+    occupancy = OccupancyMap.load(args.map) if args.map else None
+    if args.restore and os.path.exists(args.snapshot):
+        # Build the simulation the snapshot was taken of; the server restores its state on start
+        saved = Snapshot(args.snapshot)
+        args.width, args.height, args.robots, occupancy = saved.width, saved.height, saved.size, saved.occupancy
+
+    if args.script:
+        with open(args.script) as file:
+            if args.instant:
+                robot = Robot(Fleet(1, args.width, args.height))
+                robot.apply_plan(parse_plan(file))
+                x, y, direction = robot.x, robot.y, robot.direction
             else:
-                # Process as action command
-                parts = command.split()
-                if not parts:
-                    continue
-                cmd = parts[0].upper()
-                if cmd == "TURN" and len(parts) == 2:
-                    dir = parts[1].upper()
-                    if dir == "LEFT":
-                        self.command_queue.append("TURN LEFT")
-                    elif dir == "RIGHT":
-                        self.command_queue.append("TURN RIGHT")
-                    else:
-                        print(f"Invalid turn direction: {dir}")
-                elif cmd in ["FORWARD", "BACKWARD"] and len(parts) == 2:
-                    try:
-                        steps = int(parts[1])
-                        action = "FORWARD 1" if cmd == "FORWARD" else "BACKWARD 1"
-                        self.command_queue.extend([action] * steps)
-                    except ValueError:
-                        print(f"Invalid steps for {cmd}: {parts[1]}")
-                else:
-                    print(f"Unknown command: {command}")
-                client_socket.write("OK\n".encode())  # Acknowledge action command
-        if self.command_queue and not self.timer.isActive():
-            self.timer.start()
-        client_socket.disconnectFromHost()
+                x, y, direction = run_script(file, Simulation(args.robots, args.width, args.height, occupancy)).pose
+        print(f"{x} {y} {direction}")
+        return
 
-    def process_next_command(self):
-        if self.command_queue:
-            command = self.command_queue.pop(0)
-            self.process_command(command)
-        else:
-            self.timer.stop()
+    if args.headless:
+        run_headless(port=args.port, tick_interval=tick_interval, robots=args.robots, width=args.width, height=args.height,
+                     occupancy=occupancy, **server_options)
+        return
 
-    def process_command(self, command):
-        if command == "TURN LEFT":
-            self.robot.turn_left()
-        elif command == "TURN RIGHT":
-            self.robot.turn_right()
-        elif command == "FORWARD 1":
-            self.robot.move_forward(1)
-        elif command == "BACKWARD 1":
-            self.robot.move_backward(1)
-        else:
-            print(f"Unknown command in queue: {command}")
-        self.update_robot()
+    from PyQt5.QtWidgets import QApplication
+    from window import FRAME_RATE, MainWindow
 
-if __name__ == "__main__":
+    frame_rate = FRAME_RATE if args.frame_rate is None else args.frame_rate
     app = QApplication(sys.argv)
-    window = MainWindow()
+    window = MainWindow(tick_interval, args.robots, args.width, args.height, args.port, occupancy, frame_rate,
+                        **server_options)
     window.show()
-    sys.exit(app.exec_())
\ No newline at end of file
+    sys.exit(app.exec_())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import json
+import sys
+import threading
+import time
+from collections import Counter
+
+# Histogram buckets are powers of two: bucket i holds values below 2**i, up to 64-bit values
+BUCKETS = 65
+
+# Functions a thread waits in, by module file name. A sampled stack whose innermost frame is one of
+# these is a thread waiting, not working, and ends in WAITING. Calls that block in C code leave no frame
+# of their own, so it is the Python function around them that is listed: locks, events and joins wait in
+# threading, asyncio's event loop in selectors, and the GUI thread in Qt's event loop, which grid.py's
+# main() runs and is never the innermost frame otherwise.
+WAIT_FUNCTIONS = {
+    "threading.py": {"wait", "wait_for", "join", "_wait_for_tstate_lock"},
+    "queue.py": {"get", "put", "join"},
+    "selectors.py": {"select"},
+    "socket.py": {"accept", "readinto", "create_connection"},
+    "subprocess.py": {"wait", "_wait", "communicate"},
+    "grid.py": {"main"},
+}
+WAITING = "(waiting)"
+
+
+class Histogram:
+    """Distribution of non-negative integers in power-of-two buckets.
+
+    Recording is one `bit_length` and a couple of integer updates, cheap
+    enough for every command and every tick. Percentiles are estimated from
+    the buckets, so they are accurate to within a factor of two; the count,
+    mean and max are exact.
+    """
+
+    def __init__(self):
+        self.buckets = [0] * BUCKETS
+        self.total = 0
+        self.max = 0
+
+    def record(self, value):
+        self.buckets[value.bit_length()] += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    @property
+    def count(self):
+        return sum(self.buckets)
+
+    def percentile(self, p):
+        """Upper bound of the bucket holding the p-th percentile"""
+        count = self.count
+        if not count:
+            return 0
+        rank = p / 100 * count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(1 << index, self.max)
+        return self.max
+
+    def summary(self):
+        count = self.count
+        if not count:
+            return {"count": 0}
+        return {"count": count, "mean": round(self.total / count, 1), "p50": self.percentile(50),
+                "p90": self.percentile(90), "p99": self.percentile(99), "max": self.max}
+
+
+class Metrics:
+    """Counters and histograms shared by the simulation, its driver, the server and the window.
+
+    Each metric is only ever written by one thread (the server loop, the
+    simulation thread or the GUI), so recording needs no lock; a snapshot
+    taken from another thread may be a few updates behind. Durations are
+    recorded in nanoseconds and reported in microseconds.
+    """
+
+    def __init__(self):
+        self.started = time.time()
+        self.counters = Counter()
+        self.histograms = {}
+        self.gauges = {}  # Name -> callable evaluated when a snapshot is taken
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+        return histogram
+
+    def snapshot(self):
+        histograms = {}
+        for name, histogram in list(self.histograms.items()):
+            summary = histogram.summary()
+            if name.endswith("_ns"):
+                # Report durations in microseconds
+                name = name[:-3] + "_us"
+                summary = {key: value if key == "count" else round(value / 1000, 1) for key, value in summary.items()}
+            histograms[name] = summary
+        return {
+            "uptime_s": round(time.time() - self.started, 1),
+            "counters": dict(self.counters),
+            "gauges": {name: gauge() for name, gauge in list(self.gauges.items())},
+            "histograms": histograms,
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), separators=(",", ":"))
+
+
+class MetricsDumper:
+    """Appends a metrics snapshot as a JSON line to a file every `interval` seconds, and once more on stop"""
+
+    def __init__(self, metrics, path, interval=10.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, name="MetricsDumper", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        with open(self.path, "a", buffering=1) as file:
+            while not self.stopping.wait(self.interval):
+                file.write(self.metrics.to_json() + "\n")
+            file.write(self.metrics.to_json() + "\n")
+
+
+class SamplingProfiler:
+    """Samples the stacks of every other thread at a fixed interval.
+
+    Nothing is instrumented: a background thread reads `sys._current_frames`
+    every `interval` seconds and counts each stack, so the overhead is set by
+    the interval rather than by how hot the code is, and the profiler costs
+    nothing while stopped. Stacks are kept in the collapsed format that
+    flame graph tools read (`thread;outer;...;inner count`). Stacks whose
+    innermost frame is one of the WAIT_FUNCTIONS end in a WAITING frame and
+    are left out of `top`.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    @property
+    def running(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, interval=None):
+        if self.running:
+            return
+        if interval:
+            self.interval = interval
+        self.samples.clear()
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name="SamplingProfiler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.thread = None
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stopping.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                functions = []
+                code = frame.f_code
+                if code.co_name in WAIT_FUNCTIONS.get(code.co_filename.rsplit("/", 1)[-1], ()):
+                    functions.append(WAITING)
+                while frame is not None:
+                    code = frame.f_code
+                    functions.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                functions.append(names.get(ident, str(ident)))
+                self.samples[";".join(reversed(functions))] += 1
+
+    def top(self, count=10):
+        """Functions most often at the top of a busy thread's stack, as (function, share of busy samples)"""
+        leaves = Counter()
+        for stack, samples in self.samples.items():
+            leaf = stack.rsplit(";", 1)[-1]
+            if leaf != WAITING:
+                leaves[leaf] += samples
+        total = sum(leaves.values()) or 1
+        return [(function, round(samples / total, 3)) for function, samples in leaves.most_common(count)]
+
+    def write_collapsed(self, path):
+        with open(path, "w") as file:
+            for stack, samples in self.samples.most_common():
+                file.write(f"{stack} {samples}\n")
@@ -0,0 +1,58 @@
+import numpy as np
+
+# Characters that mark a blocked cell in a map file; anything else is free
+BLOCKED_CHARS = b"#X"
+
+
+class OccupancyMap:
+    """Blocked cells of the grid as a (height, width) boolean NumPy array.
+
+    Map files are plain text with one line per row of the grid: `#` (or `X`)
+    marks a blocked cell and any other character a free one. Short lines are
+    padded with free cells, so the widest line sets the width of the grid.
+    """
+
+    def __init__(self, blocked):
+        self.blocked = np.ascontiguousarray(blocked, dtype=bool)
+        self.height, self.width = self.blocked.shape
+
+    @classmethod
+    def empty(cls, width, height):
+        return cls(np.zeros((height, width), dtype=bool))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            rows = file.read().splitlines()
+        while rows and not rows[-1].strip():
+            rows.pop()
+        if not rows:
+            raise ValueError(f"Empty map file: {path}")
+        width = max(len(row) for row in rows)
+        cells = np.frombuffer(b"".join(row.ljust(width) for row in rows), dtype=np.uint8).reshape(len(rows), width)
+        return cls(np.isin(cells, np.frombuffer(BLOCKED_CHARS, dtype=np.uint8)))
+
+    def save(self, path):
+        cells = np.where(self.blocked, ord("#"), ord("."))
+        cells = np.hstack([cells, np.full((self.height, 1), ord("\n"))]).astype(np.uint8)
+        with open(path, "wb") as file:
+            file.write(cells.tobytes())
+
+    def any(self):
+        return bool(self.blocked.any())
+
+    def is_blocked(self, x, y):
+        return bool(self.blocked[y, x])
+
+    def nearest_free(self, x, y):
+        """The free cell closest to (x, y) around the torus, or None if every cell is blocked"""
+        if not self.blocked[y, x]:
+            return x, y
+        free_y, free_x = np.nonzero(~self.blocked)
+        if not len(free_x):
+            return None
+        dx = np.abs(free_x - x)
+        dy = np.abs(free_y - y)
+        distance = np.minimum(dx, self.width - dx) + np.minimum(dy, self.height - dy)
+        nearest = int(np.argmin(distance))
+        return int(free_x[nearest]), int(free_y[nearest])
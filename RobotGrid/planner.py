@@ -0,0 +1,359 @@
+import heapq
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Unit moves for each heading index (direction // 90): up, right, down, left
+DX = (0, 1, 0, -1)
+DY = (-1, 0, 1, 0)
+
+# Distance fields kept for recent targets; each takes 8 bytes per cell
+FIELD_CACHE_SIZE = 8
+
+# States an A* search from the robot may expand before the target's distance field is built instead
+ASTAR_BUDGET = 2000
+
+
+class PathPlanner:
+    """Shortest paths over the torus around blocked cells, counting turns.
+
+    The cost of a path is the number of ticks it takes: one per cell moved and
+    one per 90 degree turn. A robot can drive backward as cheaply as forward,
+    so only the axis it moves along matters and the search state is (x, y,
+    axis). `plan` returns the path as legs of (heading index, cells).
+
+    Most goals on a sparse map are reached by one of the two L-shaped paths,
+    which are checked directly with a couple of NumPy lookups. A target that
+    already has a cached `DistanceField` is read from it. Otherwise an A*
+    search from the robot runs for up to `astar_budget` states, which finds
+    paths around a few obstacles in a few milliseconds; past that budget the
+    path comes from a new distance field for the target. Fields are cached
+    for the most recent targets, so robots sent to the same place share one
+    search.
+    `plan_without_search` only reads the map and can be called from any
+    thread; searches are not thread-safe, so the simulation leaves them to
+    one `PlannerThread`. `blocked` is None for a grid without obstacles, and
+    nothing the size of the grid is allocated until the first search.
+    """
+
+    def __init__(self, width, height, blocked=None, cache_size=FIELD_CACHE_SIZE, astar_budget=ASTAR_BUDGET):
+        self.width, self.height = width, height
+        self.blocked = blocked if blocked is not None and blocked.any() else None
+        self.has_obstacles = self.blocked is not None
+        self.free = None
+        # The free mask as bytes, which index faster than NumPy from Python code
+        self.free_bytes = None
+        self.cache_size = cache_size
+        self.astar_budget = astar_budget
+        self.fields = OrderedDict()
+        # Working space for the fields' searches, one entry per state
+        self.scratch = None
+        self.stats = {"direct": 0, "astar": 0, "field_builds": 0, "field_hits": 0, "unreachable": 0}
+
+    def plan(self, x, y, heading, tx, ty):
+        """Legs from (x, y) facing `heading` to (tx, ty), or None if the target can't be reached"""
+        found, legs = self.plan_without_search(x, y, heading, tx, ty)
+        return legs if found else self.search(x, y, heading, tx, ty)
+
+    def plan_without_search(self, x, y, heading, tx, ty):
+        """(True, legs or None) if the path, or that there is none, is clear without a search, else (False, None)"""
+        if self.has_obstacles and (self.blocked[ty, tx] or self.blocked[y, x]):
+            self.stats["unreachable"] += 1
+            return True, None
+        legs = self.direct_path(x, y, heading, tx, ty)
+        if legs is not None:
+            self.stats["direct"] += 1
+            return True, legs
+        return False, None
+
+    def search(self, x, y, heading, tx, ty):
+        """Legs of a path found by A* or through the target's distance field, or None if there is none"""
+        found, legs = False, None
+        if (tx, ty) not in self.fields:
+            found, legs = self.astar(x, y, heading, tx, ty)
+        if found:
+            self.stats["astar"] += 1
+        else:
+            legs = self.distance_field(tx, ty).path(x, y, heading)
+        if legs is None:
+            self.stats["unreachable"] += 1
+        return legs
+
+    def astar(self, x, y, heading, tx, ty):
+        """(True, legs or None) if an A* search settles the path within the budget, else (False, None).
+
+        States are numbered as in `DistanceField`. The heuristic is the
+        distance around the torus plus one if a turn is still needed, which
+        never overestimates, so the first time the target is taken off the
+        heap its cost is optimal. Ties go to the deeper state, which keeps
+        the search along a straight line on open ground.
+        """
+        self.prepare()
+        width, height, cells, free = self.width, self.height, self.width * self.height, self.free_bytes
+        target = ty * width + tx
+
+        def estimate(cell, axis):
+            dx = abs(cell % width - tx)
+            dx = min(dx, width - dx)
+            dy = abs(cell // width - ty)
+            dy = min(dy, height - dy)
+            return dx + dy + (1 if (dx and (dy or not axis)) or (dy and axis) else 0)
+
+        start = (y * width + x) * 2 + heading % 2
+        costs = {start: 0}
+        previous = {start: None}
+        heap = [(estimate(start >> 1, start & 1), 0, start)]
+        expanded = 0
+        while heap:
+            _, depth, state = heapq.heappop(heap)
+            cost = -depth
+            if cost > costs[state]:
+                continue  # Reached more cheaply since it was pushed
+            cell, axis = state >> 1, state & 1
+            if cell == target:
+                return True, self.astar_legs(previous, state)
+            expanded += 1
+            if expanded > self.astar_budget:
+                return False, None
+            if axis:
+                row = cell - cell % width
+                neighbours = [row + (cell - row + 1) % width, row + (cell - row - 1) % width]
+            else:
+                neighbours = [(cell + width) % cells, (cell - width) % cells]
+            reached = [state ^ 1] + [neighbour * 2 + axis for neighbour in neighbours if free[neighbour]]
+            cost += 1
+            for following in reached:
+                if cost < costs.get(following, cost + 1):
+                    costs[following] = cost
+                    previous[following] = state
+                    heapq.heappush(heap, (cost + estimate(following >> 1, following & 1), -cost, following))
+        return True, None
+
+    def astar_legs(self, previous, state):
+        """Legs of (heading index, cells) along the states A* linked back from `state`"""
+        width, height = self.width, self.height
+        legs = []
+        while previous[state] is not None:
+            before = previous[state]
+            cell, earlier = state >> 1, before >> 1
+            if cell != earlier:
+                dx = (cell % width - earlier % width) % width
+                dy = (cell // width - earlier // width) % height
+                direction = (1 if dx == 1 else 3) if dx else (2 if dy == 1 else 0)
+                if legs and legs[-1][0] == direction:
+                    legs[-1][1] += 1
+                else:
+                    legs.append([direction, 1])
+            state = before
+        return [(direction, length) for direction, length in reversed(legs)]
+
+    def prepare(self):
+        """Allocate the free mask on the first search"""
+        if self.free is None:
+            self.free = ~self.blocked.ravel() if self.has_obstacles else np.ones(self.width * self.height, bool)
+            self.free_bytes = self.free.tobytes()
+
+    def offsets(self, x, y, tx, ty):
+        """Shortest signed offsets from (x, y) to (tx, ty) around the torus"""
+        dx = (tx - x) % self.width
+        dy = (ty - y) % self.height
+        if dx > self.width // 2:
+            dx -= self.width
+        if dy > self.height // 2:
+            dy -= self.height
+        return dx, dy
+
+    def direct_path(self, x, y, heading, tx, ty):
+        """The cheapest L-shaped path if no blocked cell is in its way, else None.
+
+        Starting along the axis the robot already faces gives the lowest
+        possible cost; the other order costs one turn more, which is still
+        optimal when the first is blocked unless the target is exactly half
+        way around the torus, where going the other way is just as short.
+        """
+        dx, dy = self.offsets(x, y, tx, ty)
+        horizontal_leg = (1 if dx > 0 else 3, abs(dx))
+        vertical_leg = (2 if dy > 0 else 0, abs(dy))
+        if heading % 2:
+            orders = [(horizontal_leg, vertical_leg), (vertical_leg, horizontal_leg)]
+        else:
+            orders = [(vertical_leg, horizontal_leg), (horizontal_leg, vertical_leg)]
+        if 2 * abs(dx) == self.width or 2 * abs(dy) == self.height:
+            orders = orders[:1]
+        for legs in orders:
+            legs = [leg for leg in legs if leg[1]]
+            if not self.has_obstacles or self.legs_free(x, y, legs):
+                return legs
+        return None
+
+    def legs_free(self, x, y, legs):
+        for direction, length in legs:
+            steps = np.arange(1, length + 1)
+            xs = (x + DX[direction] * steps) % self.width
+            ys = (y + DY[direction] * steps) % self.height
+            if self.blocked[ys, xs].any():
+                return False
+            x, y = int(xs[-1]), int(ys[-1])
+        return True
+
+    def distance_field(self, tx, ty):
+        """The cached field for (tx, ty), creating an empty one for a new target"""
+        field = self.fields.get((tx, ty))
+        if field is None:
+            self.stats["field_builds"] += 1
+            self.prepare()
+            if self.scratch is None:
+                self.scratch = np.zeros(2 * self.width * self.height, dtype=np.int32)
+            field = DistanceField(self, tx, ty)
+            self.fields[(tx, ty)] = field
+            while len(self.fields) > self.cache_size:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end((tx, ty))
+            self.stats["field_hits"] += 1
+        return field
+
+
+class DistanceField:
+    """Exact costs to one target, filled in on demand by a breadth-first search.
+
+    Every move and every turn costs one tick, so a breadth-first search from
+    the target over (cell, axis) states settles states in order of their cost
+    to it. The search is vectorized one level at a time: each level's
+    frontier of states is expanded with a handful of NumPy operations. It
+    stops as soon as the start it was asked about is reached, and a later
+    request for a start further away carries on from where it stopped, so
+    most fields are never searched completely.
+
+    States are `(y * width + x) * 2 + axis` with axis 0 vertical and 1
+    horizontal; `cost` holds -1 for states not reached yet.
+    """
+
+    def __init__(self, planner, tx, ty):
+        self.planner = planner
+        self.width, self.height = planner.width, planner.height
+        self.cells = self.width * self.height
+        self.free = planner.free
+        target = (ty * self.width + tx) * 2
+        self.cost = np.full(2 * self.cells, -1, dtype=np.int32)
+        self.frontier = np.array([target, target + 1], dtype=np.int64)
+        self.cost[self.frontier] = 0
+        self.level = 0
+
+    def solve(self, x, y, axis):
+        """Search until the state (x, y, axis) is reached; returns its cost, or None if it can't be"""
+        state = (y * self.width + x) * 2 + axis
+        width, cells, free, cost = self.width, self.cells, self.free, self.cost
+        while cost[state] < 0 and len(self.frontier):
+            frontier = self.frontier
+            self.level += 1
+            vertical = frontier[(frontier & 1) == 0] >> 1
+            horizontal = frontier[(frontier & 1) == 1] >> 1
+            column = horizontal % width
+            row = horizontal - column
+            # Up and down wrap around the flat index; left and right wrap within the row
+            moves = np.concatenate([(vertical + width) % cells, (vertical - width) % cells])
+            slides = np.concatenate([row + (column + 1) % width, row + (column - 1) % width])
+            reached = np.concatenate([frontier ^ 1, moves[free[moves]] * 2, slides[free[slides]] * 2 + 1])
+            reached = reached[cost[reached] < 0]
+            # Drop duplicates without sorting: only the last write of each state survives
+            order = np.arange(len(reached))
+            self.planner.scratch[reached] = order
+            reached = reached[self.planner.scratch[reached] == order]
+            cost[reached] = self.level
+            self.frontier = reached
+        return int(cost[state]) if cost[state] >= 0 else None
+
+    def path(self, x, y, heading):
+        """Legs of an optimal path from (x, y) facing `heading`, or None if there is none"""
+        axis = heading % 2
+        remaining = self.solve(x, y, axis)
+        if remaining is None:
+            return None
+        costs = self.cost.reshape(self.height, self.width, 2)
+        legs = []
+        while remaining:
+            values = costs[:, :, axis]
+            # Prefer the way the robot faces so it drives forward
+            for direction in sorted((1, 3) if axis else (0, 2), key=lambda d: d != heading):
+                if values[(y + DY[direction]) % self.height, (x + DX[direction]) % self.width] == remaining - 1:
+                    break
+            else:
+                # Nothing along this axis gets closer, so turning must
+                axis ^= 1
+                remaining -= 1
+                continue
+            # Keep going straight for as long as every cell is one tick closer
+            steps = np.arange(1, min(self.width if axis else self.height, remaining + 1))
+            xs = (x + DX[direction] * steps) % self.width
+            ys = (y + DY[direction] * steps) % self.height
+            downhill = values[ys, xs] == remaining - steps
+            length = len(steps) if downhill.all() else int(np.argmin(downhill))
+            legs.append((direction, length))
+            x, y = int(xs[length - 1]), int(ys[length - 1])
+            heading = direction
+            remaining -= length
+        return legs
+
+
+class PlannerThread:
+    """Runs a planner's searches on a background thread.
+
+    `request` queues a search and returns at once; results are collected
+    with `results`, and `on_ready` (if set) is called from the planner thread
+    whenever one is added. Every search runs on the same thread, one at a
+    time, so the planner's cached fields need no lock. The thread is started
+    on demand and exits once it has nothing left to do.
+    """
+
+    def __init__(self, planner, on_ready=None):
+        self.planner = planner
+        self.on_ready = on_ready
+        self.requests = queue.SimpleQueue()
+        self.finished = queue.SimpleQueue()
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def request(self, key, x, y, heading, tx, ty):
+        """Search for a path; its legs come back from `results` as (key, legs)"""
+        with self.lock:
+            self.requests.put((key, (x, y, heading, tx, ty)))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="PathPlanner", daemon=True)
+                self.thread.start()
+
+    def results(self):
+        """(key, legs) of every search finished since the last call"""
+        self.ready.clear()
+        results = []
+        while True:
+            try:
+                results.append(self.finished.get_nowait())
+            except queue.Empty:
+                return results
+
+    def wait(self, timeout=None):
+        """Block until a result is ready; returns False on timeout"""
+        return self.ready.wait(timeout)
+
+    def _run(self):
+        while True:
+            with self.lock:
+                try:
+                    key, arguments = self.requests.get_nowait()
+                except queue.Empty:
+                    self.thread = None
+                    return
+            try:
+                legs = self.planner.search(*arguments)
+            except Exception as e:
+                # Report the robot as having no path rather than leaving it waiting forever
+                print(f"Path search from {arguments[:2]} to {arguments[3:]} failed: {e!r}")
+                legs = None
+            self.finished.put((key, legs))
+            self.ready.set()
+            if self.on_ready is not None:
+                self.on_ready()
@@ -0,0 +1,403 @@
+import asyncio
+import json
+import os
+import threading
+import time
+
+import wire
+from engine import CENTER, GOTO, parse_action, parse_robot
+from metrics import MetricsDumper, SamplingProfiler
+import snapshot
+
+# Subscribers get at most this many pushes per second; faster ticks are coalesced
+PUSH_RATE = 100
+
+
+class GridServer:
+    """TCP front end for the robot grid that runs on its own thread.
+
+    An asyncio loop accepts any number of concurrent clients and parses their
+    commands off the UI thread. Validated action commands are handed to the
+    simulation through its thread-safe inbox; `on_command` (if given) is
+    called from the server thread whenever new commands are queued, so the
+    simulation driver can wake up without polling.
+
+    Clients speak the newline-delimited text protocol unless they negotiate
+    the binary framing in `wire` with a `PROTOCOL` line. A text client can
+    `SUBSCRIBE` to a robot to have its state pushed as `EVENT` lines while the
+    simulation ticks; see `Subscription`.
+
+    The server records its command counts, errors and handling times in the
+    simulation's metrics. `STATS` answers with a JSON snapshot of them, and
+    `PROFILE START [ms]` / `PROFILE STOP` sample where every thread spends its
+    time. With `metrics_path` a snapshot is also appended to that file every
+    `metrics_interval` seconds; with `profile_path` the profiler runs for the
+    server's whole lifetime and its stacks are written there on stop.
+
+    With `snapshot_path` the simulation is checkpointed there every
+    `snapshot_interval` seconds and when the server stops; `SNAPSHOT` takes
+    one right away and `RESTORE` rolls the simulation back to the file. With
+    `restore` the file, if it exists, is restored before serving.
+    """
+
+    def __init__(self, host, port, simulation, on_command=None, metrics_path=None, metrics_interval=10.0,
+                 profile_path=None, snapshot_path=None, snapshot_interval=10.0, restore=False):
+        self.host = host
+        self.port = port
+        self.simulation = simulation
+        self.on_command = on_command
+        self.metrics = simulation.metrics
+        self.command_time = self.metrics.histogram("command_ns")
+        self.batch_time = self.metrics.histogram("batch_ns")
+        self.metrics.gauges.update(clients=lambda: len(self.clients), subscriptions=lambda: len(self.subscriptions))
+        self.dumper = MetricsDumper(self.metrics, metrics_path, metrics_interval) if metrics_path else None
+        self.profiler = SamplingProfiler()
+        self.profile_path = profile_path
+        self.snapshot_path = snapshot_path
+        self.checkpointer = snapshot.Checkpointer(simulation, snapshot_path, snapshot_interval) if snapshot_path else None
+        self.restore_on_start = restore
+        self.loop = None
+        self.thread = None
+        self.server = None
+        self.clients = set()
+        self.subscriptions = set()
+        self.push_scheduled = False
+        self.last_push = 0.0
+        self.started = threading.Event()
+        self.error = None
+        simulation.add_observer(self.on_state_changed)
+
+    def start(self):
+        """Start listening on a background thread; raises OSError if the port can't be bound"""
+        if self.restore_on_start and self.snapshot_path and os.path.exists(self.snapshot_path):
+            self.restore()
+        self.thread = threading.Thread(target=self._run, name="GridServer", daemon=True)
+        self.thread.start()
+        self.started.wait()
+        if self.error:
+            raise self.error
+        if self.dumper is not None:
+            self.dumper.start()
+        if self.profile_path:
+            self.profiler.start()
+        if self.checkpointer is not None:
+            self.checkpointer.start()
+
+    def stop(self):
+        if self.loop is not None and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.thread is not None:
+            self.thread.join()
+        if self.dumper is not None:
+            self.dumper.stop()
+        if self.profile_path:
+            self.profiler.stop()
+            self.profiler.write_collapsed(self.profile_path)
+        if self.checkpointer is not None:
+            self.checkpointer.stop()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(
+                asyncio.start_server(self.handle_client, self.host, self.port, backlog=1024))
+            # Pick up the real port when listening on port 0
+            self.port = self.server.sockets[0].getsockname()[1]
+        except OSError as e:
+            self.error = e
+            self.started.set()
+            return
+        self.started.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+            for subscription in self.subscriptions:
+                subscription.close()
+            tasks = [subscription.task for subscription in self.subscriptions]
+            self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+
+    async def handle_client(self, reader, writer):
+        self.clients.add(writer)
+        self.metrics.counters["connections"] += 1
+        subscriptions = {}
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                command = line.decode(errors="replace").strip()
+                if not command:
+                    continue
+                if command.upper().startswith("PROTOCOL"):
+                    version = wire.negotiate(command)
+                    writer.write(f"PROTOCOL {version}\n".encode())
+                    if version:
+                        await self.handle_binary(reader, writer)
+                        break
+                    continue
+                start = time.perf_counter_ns()
+                reply = self.handle_subscription(command, writer, subscriptions)
+                if reply is None:
+                    reply = self.handle_command(command)
+                self.command_time.record(time.perf_counter_ns() - start)
+                self.metrics.counters["text_commands"] += 1
+                if reply is not None:
+                    writer.write(f"{reply}\n".encode())
+                    # Only wait when the client isn't keeping up with replies
+                    if writer.transport.get_write_buffer_size() > 65536:
+                        await writer.drain()
+        except (ConnectionError, ValueError):
+            # Dropped connection or a line longer than the stream limit
+            pass
+        finally:
+            for subscription in subscriptions.values():
+                subscription.close()
+                self.subscriptions.discard(subscription)
+            self.clients.discard(writer)
+            writer.close()
+
+    def handle_subscription(self, command, writer, subscriptions):
+        """Handle SUBSCRIBE/UNSUBSCRIBE for one connection; returns None for any other command"""
+        try:
+            robot, rest = parse_robot(command, self.simulation.fleet.size)
+        except ValueError:
+            return None  # Reported by handle_command
+        rest = rest.upper()
+        if rest == "SUBSCRIBE":
+            # A subscription closed by a restore that removed its robot is replaced
+            if subscriptions.get(robot) not in self.subscriptions:
+                subscription = Subscription(robot, writer)
+                subscriptions[robot] = subscription
+                self.subscriptions.add(subscription)
+                # Start with the current state rather than waiting for the next tick
+                with self.simulation.lock:
+                    subscription.update(self.simulation.ticks, self.robot_state(robot))
+            return "OK"
+        elif rest == "UNSUBSCRIBE":
+            subscription = subscriptions.pop(robot, None)
+            if subscription is not None:
+                subscription.close()
+                self.subscriptions.discard(subscription)
+            return "OK"
+        return None
+
+    def robot_state(self, robot):
+        return (*self.simulation.fleet.pose(robot), *self.simulation.fleet.progress(robot))
+
+    def on_state_changed(self, simulation):
+        """Observer called on the simulation thread after every tick"""
+        # Only flag the change; the push reads whatever state is current when it runs, so
+        # every tick until then is coalesced and the tick itself stays cheap
+        if self.push_scheduled or not self.subscriptions or self.loop is None:
+            return
+        self.push_scheduled = True
+        self.loop.call_soon_threadsafe(self.schedule_push)
+
+    def schedule_push(self):
+        self.loop.call_later(max(0.0, self.last_push + 1 / PUSH_RATE - self.loop.time()), self.push)
+
+    def push(self):
+        self.push_scheduled = False
+        self.last_push = self.loop.time()
+        robots = {subscription.robot for subscription in self.subscriptions}
+        with self.simulation.lock:
+            tick = self.simulation.ticks
+            states = {robot: self.robot_state(robot) for robot in robots}
+        for subscription in self.subscriptions:
+            state = states.get(subscription.robot)
+            if state is not None:
+                subscription.update(tick, state)
+
+    async def handle_binary(self, reader, writer):
+        """Serve BATCH frames until the client disconnects or desynchronizes the stream"""
+        while True:
+            try:
+                header = await reader.readexactly(wire.HEADER.size)
+            except asyncio.IncompleteReadError:
+                return
+            length, version, frame_type, request_id = wire.HEADER.unpack(header)
+            if version != wire.VERSION:
+                self.metrics.counters["frame_errors"] += 1
+                writer.write(wire.encode_error(request_id, wire.UNSUPPORTED_VERSION, f"Unsupported version {version}"))
+                return
+            if length > wire.MAX_PAYLOAD:
+                self.metrics.counters["frame_errors"] += 1
+                writer.write(wire.encode_error(request_id, wire.MALFORMED_FRAME, f"Payload of {length} bytes too large"))
+                return
+            try:
+                payload = await reader.readexactly(length)
+            except asyncio.IncompleteReadError:
+                return
+            if frame_type != wire.BATCH:
+                self.metrics.counters["frame_errors"] += 1
+                writer.write(wire.encode_error(request_id, wire.MALFORMED_FRAME, f"Unexpected frame type {frame_type}"))
+                continue
+            try:
+                commands = wire.decode_commands(payload)
+            except ValueError as e:
+                self.metrics.counters["frame_errors"] += 1
+                writer.write(wire.encode_error(request_id, wire.MALFORMED_FRAME, str(e)))
+                continue
+            start = time.perf_counter_ns()
+            results = []
+            queued = False
+            errors = 0
+            for opcode, robot, count in commands:
+                result = self.execute(opcode, robot, count)
+                queued = queued or (result[0] == wire.OK and opcode in wire.ACTIONS)
+                errors += result[0] != wire.OK
+                results.append(result)
+            self.batch_time.record(time.perf_counter_ns() - start)
+            self.metrics.counters["binary_commands"] += len(results)
+            if errors:
+                self.metrics.counters["errors"] += errors
+            # Wake the simulation once per batch rather than once per command
+            if queued and self.on_command is not None:
+                self.on_command()
+            writer.write(wire.encode_reply(request_id, results))
+            if writer.transport.get_write_buffer_size() > 65536:
+                await writer.drain()
+
+    def execute(self, opcode, robot=0, count=1):
+        """Run one binary command and return its (status, a, b, c) result record"""
+        if robot >= self.simulation.fleet.size:
+            return wire.UNKNOWN_ROBOT, 0, 0, 0
+        if opcode in wire.ACTIONS:
+            fleet = self.simulation.fleet
+            if count < (0 if opcode == GOTO else 1) or (opcode == GOTO and count >= fleet.width * fleet.height):
+                return wire.INVALID_ARGUMENT, 0, 0, 0
+            self.simulation.submit(opcode, 1 if opcode == CENTER else count, robot)
+            return wire.OK, 0, 0, 0
+        if opcode in wire.QUERIES.values():
+            # Unused values are padded with zeros
+            values = self.query(opcode, robot)
+            return (wire.OK, *values) + (0,) * (3 - len(values))
+        return wire.UNKNOWN_COMMAND, 0, 0, 0
+
+    def query(self, opcode, robot=0):
+        """Values answered by a query opcode"""
+        fleet = self.simulation.fleet
+        if opcode == wire.GET_DIMENSIONS:
+            # The third value tells clients whether moves can be stopped by obstacles
+            return fleet.width, fleet.height, int(fleet.blocked is not None)
+        elif opcode == wire.GET_ROBOTS:
+            return (fleet.size,)
+        return self.simulation.get_pose(robot)
+
+    def handle_command(self, command):
+        """Handle one protocol line and return the reply, or None if no reply is due"""
+        upper = command.upper()
+        if upper == "STATS":
+            return self.metrics.to_json()
+        if upper.startswith("PROFILE"):
+            return self.handle_profile(upper.split())
+        if upper in ("SNAPSHOT", "RESTORE"):
+            if self.checkpointer is None:
+                return "ERROR No snapshot file configured"
+            if upper == "SNAPSHOT":
+                self.checkpointer.request()
+                return "OK"
+            try:
+                self.restore()
+            except (OSError, ValueError) as e:
+                self.metrics.counters["errors"] += 1
+                print(e)
+                return f"ERROR {e}"
+            return "OK"
+        # Commands may be addressed to a robot with an R<id> prefix, e.g. "R42 FORWARD 3"
+        try:
+            robot, command = parse_robot(command, self.simulation.fleet.size)
+        except ValueError as e:
+            self.metrics.counters["errors"] += 1
+            print(e)
+            return "OK"
+        query = wire.QUERIES.get(command.upper())
+        if query is not None:
+            return " ".join(map(str, self.query(query, robot)))
+        # Process as action command
+        try:
+            opcode, count = parse_action(command, self.simulation.fleet.width, self.simulation.fleet.height)
+        except ValueError as e:
+            self.metrics.counters["errors"] += 1
+            print(e)
+        else:
+            self.simulation.submit(opcode, count, robot)
+            if self.on_command is not None:
+                self.on_command()
+        return "OK"  # Acknowledge action command
+
+    def restore(self):
+        """Roll the simulation back to the snapshot file"""
+        start = time.perf_counter_ns()
+        snapshot.restore(self.simulation, snapshot.Snapshot(self.snapshot_path))
+        # Robots beyond a smaller restored fleet are gone, and so are their subscriptions
+        for subscription in [subscription for subscription in self.subscriptions
+                             if subscription.robot >= self.simulation.fleet.size]:
+            subscription.close()
+            self.subscriptions.discard(subscription)
+        self.metrics.histogram("restore_ns").record(time.perf_counter_ns() - start)
+        if self.on_command is not None and self.simulation.fleet.busy():
+            self.on_command()
+
+    def handle_profile(self, parts):
+        """`PROFILE START [interval ms]` and `PROFILE STOP`; both stop and a bare `PROFILE` reply with the top functions"""
+        if parts[1:2] == ["START"]:
+            try:
+                interval = float(parts[2]) / 1000 if len(parts) > 2 else None
+            except ValueError:
+                interval = None
+            if interval is not None and interval <= 0:
+                interval = None
+            self.profiler.start(interval)
+            return "OK"
+        if parts[1:2] == ["STOP"]:
+            self.profiler.stop()
+        return json.dumps({"running": self.profiler.running, "interval_ms": self.profiler.interval * 1000,
+                           "samples": sum(self.profiler.samples.values()), "top": self.profiler.top()})
+
+
+class Subscription:
+    """State pushed to one subscribed client for one robot.
+
+    Events are `EVENT <tick> R<robot> <x> <y> <direction> <queued> <completed>`
+    lines, where queued and completed count steps. Only the latest state is
+    kept: a sender task writes it and waits for the transport to drain, and
+    whatever changed meanwhile is coalesced into one event. A slow client
+    therefore only skips intermediate states, holds at most one pending event
+    plus the transport buffer, and never stalls the server or other clients.
+    Ticks in events only ever increase.
+    """
+
+    def __init__(self, robot, writer):
+        self.robot = robot
+        self.writer = writer
+        self.state = None
+        self.event = None
+        self.ready = asyncio.Event()
+        self.task = asyncio.get_running_loop().create_task(self.send_events())
+
+    def update(self, tick, state):
+        if state == self.state:
+            return
+        self.state = state
+        self.event = f"EVENT {tick} R{self.robot} {' '.join(map(str, state))}\n"
+        self.ready.set()
+
+    async def send_events(self):
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                self.writer.write(self.event.encode())
+                await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    def close(self):
+        self.task.cancel()
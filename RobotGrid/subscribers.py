@@ -0,0 +1,55 @@
+"""Subscribers following robot 0 of a running GridServer, shared by the subscribe benchmark and its test"""
+
+import asyncio
+import socket
+import time
+
+
+async def subscriber(port, steps, pause, received):
+    """Follow robot 0 until all steps have completed; returns the ticks of the events received"""
+    sock = socket.socket()
+    if pause:
+        # Keep the kernel from absorbing the backlog so the server sees the slow reader
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    writer.write(b"SUBSCRIBE\n")
+    await reader.readline()
+    received.set()
+    # A slow subscriber stops reading for a while and lets the server's buffers fill up
+    await asyncio.sleep(pause)
+    ticks = []
+    while True:
+        parts = (await reader.readline()).split()
+        if not parts or parts[0] != b"EVENT":
+            continue
+        ticks.append(int(parts[1]))
+        if int(parts[7]) == steps:
+            break
+    writer.close()
+    await writer.wait_closed()
+    return ticks
+
+
+async def run_subscribers(server, subscribers, slow, pause, steps):
+    """Subscribe `subscribers` clients to robot 0, the first `slow` of them pausing for `pause` seconds, and
+    drive it `steps` steps forward; returns each client's event ticks, the most bytes the server held for
+    them, and the time taken"""
+    subscribed = [asyncio.Event() for _ in range(subscribers)]
+    pauses = [pause if i < slow else 0 for i in range(subscribers)]
+    tasks = [asyncio.create_task(subscriber(server.port, steps, pause, event))
+             for pause, event in zip(pauses, subscribed)]
+    await asyncio.gather(*(event.wait() for event in subscribed))
+
+    start = time.perf_counter()
+    _, writer = await asyncio.open_connection("127.0.0.1", server.port)
+    writer.write(f"FORWARD {steps}\n".encode())
+    buffered = 0
+    while not all(task.done() for task in tasks):
+        # Bytes the server is holding for its subscribers, beyond what the kernel buffers
+        buffered = max(buffered, sum(subscription.writer.transport.get_write_buffer_size()
+                                     for subscription in list(server.subscriptions)))
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return [task.result() for task in tasks], buffered, elapsed
@@ -0,0 +1,36 @@
+import asyncio
+
+from engine import Simulation, SimulationRunner
+from server import GridServer
+from subscribers import run_subscribers
+
+SUBSCRIBERS = 20
+SLOW = 5  # Subscribers that stop reading until after the robot has finished
+STEPS = 20000
+
+# A subscription waits for its transport to drain below asyncio's default
+# high-water mark before writing again, so it never holds more than that plus
+# one pending event, however many events it falls behind
+MAX_BUFFERED_PER_SUBSCRIBER = 64 * 1024 + 256
+
+
+def test_subscribers_get_ordered_updates_with_bounded_buffers():
+    simulation = Simulation()
+    runner = SimulationRunner(simulation, tick_interval=0)
+    server = GridServer("127.0.0.1", 0, simulation, on_command=runner.wake)
+    server.start()
+    runner.start()
+    try:
+        results, buffered, _ = asyncio.run(asyncio.wait_for(
+            run_subscribers(server, SUBSCRIBERS, SLOW, pause=0.5, steps=STEPS), 60))
+    finally:
+        server.stop()
+        runner.stop()
+
+    assert simulation.ticks == STEPS
+    assert simulation.pose == (7, (7 - STEPS) % 15, 0)
+    for ticks in results:
+        assert ticks, "every subscriber receives events"
+        assert all(a < b for a, b in zip(ticks, ticks[1:])), "ticks only ever increase"
+        assert ticks[-1] == STEPS, "every subscriber sees the final state"
+    assert buffered <= SUBSCRIBERS * MAX_BUFFERED_PER_SUBSCRIBER
@@ -0,0 +1,242 @@
+import sys
+import os
+import math
+import time
+from PyQt5.QtWidgets import QMainWindow, QGraphicsView, QGraphicsScene, QGraphicsPixmapItem, QPushButton, QVBoxLayout, QWidget, QLabel
+from PyQt5.QtCore import Qt, QLineF, QRectF, QTimer, pyqtSignal
+from PyQt5.QtGui import QPen, QBrush, QColor, QImage, QPalette, QPixmap, QPainter
+import numpy as np
+from engine import GRID_HEIGHT, GRID_WIDTH, Simulation, SimulationRunner
+from server import GridServer
+
+FRAME_RATE = 60  # Most robot redraws per second; 0 redraws on every simulation step
+CELL_SIZE = 40  # Scene units per grid cell
+MIN_TILE_SPACING = 20  # On-screen cell size in pixels below which the tile pixmap is not used
+MIN_LINE_SPACING = 6  # Closest on-screen spacing of grid lines when zoomed out
+OBSTACLE_COLOR = 0xFF8C4A2F  # ARGB of blocked cells
+DIRECTION_NAMES = {0: "Up", 90: "Right", 180: "Down", 270: "Left"}
+
+class GridScene(QGraphicsScene):
+    """Scene that paints the grid in drawBackground rather than holding one item per line.
+
+    Only the exposed part of the grid is painted. At normal zoom a cached
+    one-cell tile pixmap is tiled across it; when zoomed far out only every
+    n-th line is drawn, so the cost of a frame depends on the viewport and not
+    on the size of the grid. Obstacles are kept in an image with one pixel per
+    cell, and the exposed cells of it are scaled up over the grid lines.
+    """
+
+    def __init__(self, width, height, occupancy=None):
+        super().__init__(0, 0, width * CELL_SIZE, height * CELL_SIZE)
+        self.grid_width = width
+        self.grid_height = height
+        self.setBackgroundBrush(QBrush(QColor(25, 25, 25)))
+        self.pen = QPen(Qt.white)
+
+        # One cell with its top and left edges; neighbouring tiles supply the rest
+        self.tile = QPixmap(CELL_SIZE, CELL_SIZE)
+        self.tile.fill(QColor(25, 25, 25))
+        painter = QPainter(self.tile)
+        painter.setPen(self.pen)
+        painter.drawLine(0, 0, CELL_SIZE - 1, 0)
+        painter.drawLine(0, 0, 0, CELL_SIZE - 1)
+        painter.end()
+
+        self.obstacles = None
+        if occupancy is not None and occupancy.any():
+            # QImage doesn't copy the buffer, so the array is kept alongside it
+            self.obstacle_pixels = np.where(occupancy.blocked, OBSTACLE_COLOR, 0).astype(np.uint32)
+            self.obstacles = QImage(self.obstacle_pixels.data, width, height, width * 4, QImage.Format_ARGB32)
+
+    def drawBackground(self, painter, rect):
+        painter.fillRect(rect, self.backgroundBrush())
+        grid = rect.intersected(self.sceneRect())
+        if grid.isEmpty():
+            return
+
+        # Snap the exposed area outwards to whole cells
+        left = math.floor(grid.left() / CELL_SIZE)
+        top = math.floor(grid.top() / CELL_SIZE)
+        right = min(math.ceil(grid.right() / CELL_SIZE), self.grid_width)
+        bottom = min(math.ceil(grid.bottom() / CELL_SIZE), self.grid_height)
+
+        spacing = CELL_SIZE * painter.worldTransform().m11()  # On-screen pixels per cell
+        if spacing >= MIN_TILE_SPACING:
+            target = QRectF(left * CELL_SIZE, top * CELL_SIZE, (right - left) * CELL_SIZE, (bottom - top) * CELL_SIZE)
+            painter.drawTiledPixmap(target, self.tile)
+        else:
+            # Level of detail: only draw every stride-th line
+            stride = 1
+            while spacing * stride < MIN_LINE_SPACING:
+                stride *= 2
+            painter.setPen(self.pen)
+            lines = [QLineF(i * CELL_SIZE, top * CELL_SIZE, i * CELL_SIZE, bottom * CELL_SIZE)
+                     for i in range(math.ceil(left / stride) * stride, right + 1, stride)]
+            lines += [QLineF(left * CELL_SIZE, i * CELL_SIZE, right * CELL_SIZE, i * CELL_SIZE)
+                      for i in range(math.ceil(top / stride) * stride, bottom + 1, stride)]
+            painter.drawLines(lines)
+
+        if self.obstacles is not None:
+            target = QRectF(left * CELL_SIZE, top * CELL_SIZE, (right - left) * CELL_SIZE, (bottom - top) * CELL_SIZE)
+            painter.drawImage(target, self.obstacles, QRectF(left, top, right - left, bottom - top))
+
+        # Closing lines along the right and bottom edges of the grid
+        painter.setPen(self.pen)
+        scene = self.sceneRect()
+        painter.drawLine(QLineF(scene.right(), scene.top(), scene.right(), scene.bottom()))
+        painter.drawLine(QLineF(scene.left(), scene.bottom(), scene.right(), scene.bottom()))
+
+class MainWindow(QMainWindow):
+    """Window showing robot 0 of the simulation, with the TCP server for the whole fleet.
+
+    Drawing is decoupled from the simulation: a step only marks the display
+    as out of date, and the robot is redrawn at most `frame_rate` times a
+    second with whatever pose is current by then. The view caches the
+    painted background and repaints only the regions that changed, so a
+    frame costs about one robot's worth of painting. A frame rate of 0
+    redraws on every step with Qt's default full-viewport updates instead.
+    """
+
+    # Emitted from the simulation thread; delivered on the GUI thread as a queued signal
+    state_changed = pyqtSignal()
+
+    def __init__(self, tick_interval=0.5, robots=1, width=GRID_WIDTH, height=GRID_HEIGHT, port=12345, occupancy=None,
+                 frame_rate=FRAME_RATE, **server_options):
+        super().__init__()
+        self.setWindowTitle("Robot Display")
+        self.setGeometry(100, 100, 620, 650)  # Fits 600x600 scene + controls
+
+        # Dark mode palette
+        palette = QPalette()
+        palette.setColor(QPalette.Window, QColor(53, 53, 53))
+        palette.setColor(QPalette.WindowText, Qt.white)
+        palette.setColor(QPalette.Base, QColor(25, 25, 25))
+        palette.setColor(QPalette.Text, Qt.white)
+        palette.setColor(QPalette.Button, QColor(53, 53, 53))
+        palette.setColor(QPalette.ButtonText, Qt.white)
+        self.setPalette(palette)
+
+        # Central widget and layout
+        central_widget = QWidget()
+        self.setCentralWidget(central_widget)
+        layout = QVBoxLayout()
+        central_widget.setLayout(layout)
+
+        # Graphics view and scene; the grid itself is painted as the scene background
+        self.view = QGraphicsView()
+        if occupancy is not None:
+            width, height = occupancy.width, occupancy.height
+        self.scene = GridScene(width, height, occupancy)
+        self.view.setScene(self.scene)
+        if frame_rate:
+            # The grid never changes, so paint it once and blit it behind the robot
+            self.view.setCacheMode(QGraphicsView.CacheBackground)
+            self.view.setViewportUpdateMode(QGraphicsView.MinimalViewportUpdate)
+            self.view.setOptimizationFlag(QGraphicsView.DontSavePainterState)
+        layout.addWidget(self.view)
+
+        # The simulation runs on its own thread; the window only observes it
+        self.simulation = Simulation(robots, width, height, occupancy)
+        self.robot = self.simulation.robot
+        self.update_pending = False
+        self.frame_time = self.simulation.metrics.histogram("frame_ns")
+        self.frame_interval = 1 / frame_rate if frame_rate else 0
+        self.last_frame = 0.0
+        self.frame_timer = QTimer(self)
+        self.frame_timer.setSingleShot(True)
+        self.frame_timer.timeout.connect(self.update_robot)
+        self.state_changed.connect(self.schedule_frame if frame_rate else self.update_robot)
+        self.simulation.add_observer(self.on_state_changed)
+
+        # Initialize robot with icon
+        self.robot_item = QGraphicsPixmapItem()
+        self.scene.addItem(self.robot_item)
+
+        # Load robot image
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        image_path = os.path.join(script_dir, "robot.jpg")
+        pixmap = QPixmap(image_path)
+        if pixmap.isNull():
+            print(f"Error: {image_path} not found, using default image")
+            pixmap = QPixmap(40, 40)
+            pixmap.fill(Qt.transparent)
+            painter = QPainter(pixmap)
+            painter.setBrush(QBrush(Qt.blue))
+            painter.drawEllipse(0, 0, 40, 40)
+            painter.end()
+            self.robot_item.setPixmap(pixmap)
+            self.robot_item.setTransformOriginPoint(20, 20)
+        else:
+            pixmap = pixmap.scaled(40, 40, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+            self.robot_item.setPixmap(pixmap)
+            self.robot_item.setTransformOriginPoint(pixmap.width() / 2, pixmap.height() / 2)
+
+        # Set initial position and rotation; the item sits centered in its cell
+        self.robot_offset_x = CELL_SIZE / 2 - self.robot_item.pixmap().width() / 2
+        self.robot_offset_y = CELL_SIZE / 2 - self.robot_item.pixmap().height() / 2
+        self.displayed_pose = self.simulation.pose
+        self.robot_item.setPos(self.robot.x * CELL_SIZE + self.robot_offset_x, self.robot.y * CELL_SIZE + self.robot_offset_y)
+        self.robot_item.setRotation(self.robot.direction)
+
+        # Center button
+        self.center_button = QPushButton("Center Robot")
+        self.center_button.clicked.connect(self.on_center_clicked)
+        layout.addWidget(self.center_button)
+
+        # Status label
+        direction_text = DIRECTION_NAMES[self.robot.direction]
+        self.status_label = QLabel(f"Grid: {width}x{height} | Position: ({self.robot.x}, {self.robot.y}), Facing: {direction_text}")
+        layout.addWidget(self.status_label)
+
+        # Simulation driver and TCP server, each on its own thread
+        self.runner = SimulationRunner(self.simulation, tick_interval)
+        self.server = GridServer("127.0.0.1", port, self.simulation, on_command=self.runner.wake, **server_options)
+        try:
+            self.server.start()
+        except OSError as e:
+            print(f"Failed to start server: {e}")
+            sys.exit(1)
+        self.runner.start()
+
+    def on_state_changed(self, simulation):
+        # Coalesce steps so a fast tick rate can't flood the GUI event queue
+        if not self.update_pending:
+            self.update_pending = True
+            self.state_changed.emit()
+
+    def schedule_frame(self):
+        """Draw the next frame as soon as the frame rate allows"""
+        if not self.frame_timer.isActive():
+            delay = self.last_frame + self.frame_interval - time.monotonic()
+            self.frame_timer.start(max(0, int(delay * 1000)))
+
+    def update_robot(self):
+        start = time.perf_counter_ns()
+        self.last_frame = time.monotonic()
+        # Steps from here on need a new frame
+        self.update_pending = False
+        pose = self.simulation.pose
+        if pose == self.displayed_pose:
+            return
+        x, y, direction = pose
+        self.robot_item.setPos(x * CELL_SIZE + self.robot_offset_x, y * CELL_SIZE + self.robot_offset_y)
+        if direction != self.displayed_pose[2]:
+            self.robot_item.setRotation(direction)
+        self.displayed_pose = pose
+        # Follow the robot on grids larger than the view. Recentering only once it
+        # leaves the view scrolls far less often than keeping it just inside, and
+        # every scroll repaints the whole viewport
+        visible = self.view.mapToScene(self.view.viewport().rect()).boundingRect()
+        if not visible.contains(self.robot_item.sceneBoundingRect()):
+            self.view.centerOn(self.robot_item)
+
+        self.status_label.setText(f"Grid: {self.scene.grid_width}x{self.scene.grid_height} | Position: ({x}, {y}), Facing: {DIRECTION_NAMES[direction]}")
+        self.frame_time.record(time.perf_counter_ns() - start)
+
+    def on_center_clicked(self):
+        self.simulation.center()
+
+    def closeEvent(self, event):
+        self.server.stop()
+        self.runner.stop()
+        super().closeEvent(event)
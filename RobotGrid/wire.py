@@ -0,0 +1,146 @@
+"""Binary framing for the grid protocol.
+
+A connection starts in the text protocol. A client that wants binary frames
+sends `PROTOCOL <version>` with the highest framing version it speaks; the
+server answers `PROTOCOL <version>` with the version it will use, or
+`PROTOCOL 0` to stay in text mode, and switches to frames right after the
+reply. Servers that predate framing answer `OK`, so clients fall back to text.
+
+Every frame starts with a header of payload length, framing version, frame
+type and a request ID chosen by the client (network byte order):
+
+    length u32 | version u8 | type u8 | request_id u32 | payload
+
+A BATCH frame carries any number of fixed-size command records and is
+answered by one REPLY frame with the same request ID and one result record
+per command, in order. An ERROR frame rejects a whole frame; after errors that
+leave the stream out of sync the server closes the connection.
+"""
+
+import socket
+import struct
+
+from engine import BACKWARD, CENTER, FORWARD, GOTO, TURN_LEFT, TURN_RIGHT
+
+VERSION = 1
+MAX_PAYLOAD = 1 << 20
+
+HEADER = struct.Struct("!IBBI")
+COMMAND = struct.Struct("!BIi")  # opcode, robot, count
+RESULT = struct.Struct("!Biii")  # status, up to three values
+
+# Frame types
+BATCH, REPLY, ERROR = 1, 2, 3
+
+# Queries share the opcode space with the engine's action opcodes. The count
+# of a GOTO command is its target cell, y * width + x.
+GET_POSITION, GET_DIMENSIONS, GET_ROBOTS = 16, 17, 18
+ACTIONS = (FORWARD, BACKWARD, TURN_LEFT, TURN_RIGHT, CENTER, GOTO)
+QUERIES = {"GET_POSITION": GET_POSITION, "GET_DIMENSIONS": GET_DIMENSIONS, "GET_ROBOTS": GET_ROBOTS}
+
+# Status codes, per command in a REPLY and per frame in an ERROR
+OK, UNKNOWN_COMMAND, INVALID_ARGUMENT, UNKNOWN_ROBOT, UNSUPPORTED_VERSION, MALFORMED_FRAME = range(6)
+
+
+def encode_frame(frame_type, request_id, payload=b"", version=VERSION):
+    return HEADER.pack(len(payload), version, frame_type, request_id) + payload
+
+
+def encode_batch(request_id, commands):
+    """A BATCH frame for (opcode, robot, count) commands"""
+    return encode_frame(BATCH, request_id, b"".join(COMMAND.pack(*command) for command in commands))
+
+
+def encode_reply(request_id, results):
+    """A REPLY frame for (status, a, b, c) results"""
+    return encode_frame(REPLY, request_id, b"".join(RESULT.pack(*result) for result in results))
+
+
+def encode_error(request_id, status, message):
+    return encode_frame(ERROR, request_id, bytes([status]) + message.encode())
+
+
+def decode_commands(payload):
+    if len(payload) % COMMAND.size:
+        raise ValueError(f"Batch payload of {len(payload)} bytes is not a whole number of commands")
+    return COMMAND.iter_unpack(payload)
+
+
+def decode_results(payload):
+    if len(payload) % RESULT.size:
+        raise ValueError(f"Reply payload of {len(payload)} bytes is not a whole number of results")
+    return list(RESULT.iter_unpack(payload))
+
+
+def negotiate(command):
+    """The framing version to answer a `PROTOCOL <version>` line with; 0 keeps the text protocol"""
+    parts = command.split()
+    if len(parts) != 2 or not parts[1].isdigit():
+        return 0
+    return min(int(parts[1]), VERSION)
+
+
+class BinaryClient:
+    """Blocking client for the binary framing, mainly for high-rate control and benchmarks.
+
+    `batch` sends one BATCH frame and returns the per-command results;
+    `send` and `receive` split that up so several batches can be in flight.
+    """
+
+    def __init__(self, host, port, timeout=5):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.file = None
+        self.next_request_id = 1
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.file = self.sock.makefile("rb")
+        self.sock.sendall(f"PROTOCOL {VERSION}\n".encode())
+        reply = self.file.readline().decode().strip()
+        if reply != f"PROTOCOL {VERSION}":
+            self.close()
+            raise ConnectionError(f"Server does not support binary framing version {VERSION} (replied {reply!r})")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+        if self.sock is not None:
+            self.sock.close()
+        self.sock = None
+        self.file = None
+
+    def send(self, commands):
+        """Send one batch without waiting; returns its request ID"""
+        request_id = self.next_request_id
+        self.next_request_id = (self.next_request_id + 1) & 0xFFFFFFFF
+        self.sock.sendall(encode_batch(request_id, commands))
+        return request_id
+
+    def receive(self):
+        """Read the next frame; returns (request_id, results) or raises ConnectionError on ERROR frames"""
+        header = self.file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ConnectionError("Connection closed by server")
+        length, version, frame_type, request_id = HEADER.unpack(header)
+        payload = self.file.read(length)
+        if frame_type == ERROR:
+            raise ConnectionError(f"Request {request_id} rejected with status {payload[0]}: {payload[1:].decode()}")
+        return request_id, decode_results(payload)
+
+    def batch(self, commands):
+        request_id = self.send(commands)
+        reply_id, results = self.receive()
+        if reply_id != request_id:
+            raise ConnectionError(f"Expected reply to request {request_id}, got {reply_id}")
+        return results
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()